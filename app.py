@@ -1,10 +1,19 @@
 import os
 from flask import Flask
 from config import config
-from database import db
+from database import db, upgrade_database
 from routes.student_routes import bp as student_bp
 from routes.attendance_routes import bp as attendance_bp
-from cache import load_known_faces  # --- IMPORT FROM CACHE.PY ---
+from recognition_engine import init_recognition_engine
+from attendance_writer import init_attendance_marker
+from models.face_tracker import init_tracker_registry
+from enrollment import init_enrollment_manager
+from metrics import init_metrics
+from readiness import init_readiness
+from routes.health_routes import bp as health_bp
+from routes.group_routes import bp as group_bp
+from routes.stream_routes import init_stream_routes
+from cli import faces_cli
 
 def create_app():
     app = Flask(__name__)
@@ -17,19 +26,30 @@ def create_app():
 
     # Initialize extensions
     db.init_app(app)
+    init_recognition_engine(app)
+    init_attendance_marker(app)
+    init_tracker_registry(app)
+    init_enrollment_manager(app)
+    init_metrics(app)
 
     # Create database tables if they don't exist
     with app.app_context():
         db.create_all()
+        upgrade_database()
+
+    # Register CLI commands ('flask faces ...')
+    app.cli.add_command(faces_cli)
 
     # Register blueprints
     app.register_blueprint(student_bp, url_prefix='/students')
     app.register_blueprint(attendance_bp, url_prefix='/')
-    
-    # --- MODIFIED: Load faces into cache on startup ---
-    # We must be inside an app context to do this
-    with app.app_context():
-        load_known_faces()
+    app.register_blueprint(group_bp)
+    app.register_blueprint(health_bp)
+    init_stream_routes(app)
+
+    # Load faces into the cache and start the recognition workers in the
+    # background, so the app serves /healthz right away
+    init_readiness(app)
 
     return app
 
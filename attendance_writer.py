@@ -0,0 +1,195 @@
+import time
+import uuid
+import atexit
+import threading
+from datetime import datetime, date
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from database import db, Attendance
+
+
+class AttendanceMarker:
+    """
+    Marks students present without touching the database on the request path.
+
+    Keeps the set of student ids already marked today (seeded from the
+    database and reset when the date changes) so repeat sightings cost
+    nothing. New marks go to a write-behind queue that a background thread
+    flushes in batches with INSERT ... ON CONFLICT DO NOTHING, relying on the
+    _date_student_uc constraint to absorb duplicates from other processes.
+
+    It also keeps a version counter for the day's attendance list, bumped
+    on every new mark, so pollers can tell that nothing changed without a
+    query. Marks made by other processes are picked up by re-checking the
+    database at most every 'sync_interval' seconds.
+    """
+
+    def __init__(self, app, flush_interval=1.0, batch_size=100, sync_interval=5.0):
+        self.app = app
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.sync_interval = sync_interval
+
+        # Distinguishes this process's versions from other workers' in ETags
+        self._token = uuid.uuid4().hex[:8]
+        self._version = 0
+        self._synced_at = None
+        self._db_state = None
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._day = None
+        self._marked = set()
+        self._pending = []
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def _roll_over(self, today):
+        """Starts a new day, seeding the marked set from the database."""
+        marked_ids = db.session.query(Attendance.student_id).filter(Attendance.date == today).all()
+        self._marked = {student_pk for (student_pk,) in marked_ids}
+        self._day = today
+        self._version += 1
+
+    def mark(self, student_pk: int, group_id=None) -> bool:
+        """
+        Marks a student present for today, recording the group whose camera
+        saw them if it was scoped to one.
+        Needs the app context the first time it is called on a new day.
+
+        Returns True if the student was newly marked, False if they already
+        were.
+        """
+        today = date.today()
+        with self._lock:
+            if self._day != today:
+                self._roll_over(today)
+
+            if student_pk in self._marked:
+                return False
+
+            self._marked.add(student_pk)
+            self._version += 1
+            self._pending.append({
+                'student_id': student_pk,
+                'date': today,
+                'timestamp': datetime.utcnow(),
+                'status': 'present',
+                'group_id': group_id
+            })
+            pending = len(self._pending)
+
+        self._ensure_thread()
+        if pending >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def etag(self) -> str:
+        """
+        Returns an entity tag for today's attendance list that changes
+        whenever a student is marked. Needs the app context; only touches the
+        database on a new day or once every sync_interval seconds.
+        """
+        today = date.today()
+        with self._lock:
+            if self._day != today:
+                self._roll_over(today)
+
+        now = time.monotonic()
+        if self._synced_at is None or now - self._synced_at >= self.sync_interval:
+            self._synced_at = now
+            state = tuple(db.session.query(func.count(Attendance.id), func.max(Attendance.id)).filter(
+                Attendance.date == today
+            ).one())
+            with self._lock:
+                if state != self._db_state:
+                    self._db_state = state
+                    self._version += 1
+
+        return f"{self._token}-{today.isoformat()}-{self._version}"
+
+    def forget(self, student_pk: int):
+        """
+        Drops a deleted student from the marked set and the queue, so a
+        student who later gets the same primary key can be marked today.
+        Waits for a flush in progress to finish first.
+        """
+        with self._flush_lock, self._lock:
+            self._marked.discard(student_pk)
+            self._pending = [row for row in self._pending if row['student_id'] != student_pk]
+            # Their attendance rows were deleted with them
+            self._version += 1
+
+    def _insert(self, rows):
+        dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+        stmt = dialect.insert(Attendance.__table__).values(rows).on_conflict_do_nothing(
+            index_elements=['date', 'student_id']
+        )
+        db.session.execute(stmt)
+        db.session.commit()
+
+    def flush(self) -> int:
+        """
+        Writes all queued marks in one statement. Returns the number of rows written.
+
+        If the batch fails, its rows are retried one at a time and those
+        that still fail (e.g. for a student deleted meanwhile) are dropped,
+        so one bad row can't block every later mark.
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+
+            try:
+                self._insert(rows)
+                return len(rows)
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f'Error flushing attendance, retrying rows one by one: {e}')
+
+            written = 0
+            for row in rows:
+                try:
+                    self._insert([row])
+                    written += 1
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f"Dropped attendance mark for student {row['student_id']}: {e}")
+            return written
+
+    def _ensure_thread(self):
+        # Started on first use so each forked server worker gets its own thread
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='attendance-writer', daemon=True)
+                    self._thread.start()
+                    atexit.register(self._flush_in_context)
+
+    def _flush_in_context(self):
+        with self.app.app_context():
+            self.flush()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._flush_in_context()
+
+
+def init_attendance_marker(app):
+    """Creates the app's AttendanceMarker from its config."""
+    marker = AttendanceMarker(
+        app,
+        flush_interval=app.config['ATTENDANCE_FLUSH_INTERVAL'],
+        batch_size=app.config['ATTENDANCE_FLUSH_BATCH'],
+        sync_interval=app.config['ATTENDANCE_SYNC_INTERVAL']
+    )
+    app.extensions['attendance_marker'] = marker
+    return marker
+
+
+def get_attendance_marker(app) -> AttendanceMarker:
+    return app.extensions['attendance_marker']
@@ -0,0 +1,65 @@
+"""
+Compares the IVF index against brute-force matching on synthetic galleries.
+
+Run from the project root:
+
+    python -m benchmarks.ann_benchmark --sizes 10000 50000 100000 --nprobe 4 8 16
+
+For every gallery size it reports recall@1 (how often the index returns the
+same best match as a full scan) and p50/p99 latency of matching one frame.
+"""
+import argparse
+import time
+import numpy as np
+from models.gallery_index import IVFIndex, brute_force_search, squared_norms
+from benchmarks.synthetic import make_gallery, make_queries
+
+
+def time_frames(search, frames):
+    """Runs 'search' on each frame and returns per-frame latencies in milliseconds."""
+    latencies = []
+    for frame in frames:
+        start = time.perf_counter()
+        search(frame)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+    return np.array(latencies)
+
+
+def run(sizes, nprobes, nlist, faces_per_frame, n_frames):
+    print(f"{'size':>8} {'method':>12} {'recall@1':>9} {'p50 ms':>9} {'p99 ms':>9} {'build s':>8}")
+    for size in sizes:
+        gallery, centers = make_gallery(size)
+        sq_norms = squared_norms(gallery)
+        queries = make_queries(centers, faces_per_frame * n_frames)
+        frames = np.split(queries, n_frames)
+
+        exact_best, _ = brute_force_search(gallery, sq_norms, queries)
+        lat = time_frames(lambda f: brute_force_search(gallery, sq_norms, f), frames)
+        print(f"{size:>8} {'exact':>12} {1.0:>9.4f} {np.percentile(lat, 50):>9.3f} {np.percentile(lat, 99):>9.3f} {'-':>8}")
+
+        start = time.perf_counter()
+        index = IVFIndex.build(gallery, nlist=nlist)
+        build_seconds = time.perf_counter() - start
+
+        for nprobe in nprobes:
+            index.nprobe = nprobe
+            ann_best, _ = index.search(gallery, sq_norms, queries)
+            recall = float(np.mean(ann_best == exact_best))
+            lat = time_frames(lambda f: index.search(gallery, sq_norms, f), frames)
+            label = f"ivf/{index.nlist}/{nprobe}"
+            print(f"{size:>8} {label:>12} {recall:>9.4f} {np.percentile(lat, 50):>9.3f} {np.percentile(lat, 99):>9.3f} {build_seconds:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000, 100000])
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--nlist', type=int, default=0, help='IVF cells (0 = sqrt(size))')
+    parser.add_argument('--faces-per-frame', type=int, default=30)
+    parser.add_argument('--frames', type=int, default=50)
+    args = parser.parse_args()
+    run(args.sizes, args.nprobe, args.nlist, args.faces_per_frame, args.frames)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Compares the per-photo gallery against per-student prototype galleries.
+
+Run from the project root:
+
+    python -m benchmarks.prototype_benchmark --students 5000 --photos 10 --prototypes 1 2 3
+
+Every student gets several enrolled photos spread over a few distinct looks.
+For each gallery it reports the number of rows, accuracy (fraction of live
+faces matched to the right student), agreement with the per-photo gallery,
+and p50/p99 latency of matching one frame. 'segmin' is the per-photo gallery
+matched through the student-level segmented minimum.
+"""
+import argparse
+import time
+import numpy as np
+from models.gallery_index import brute_force_search, squared_norms
+from models.prototypes import match_students, reduce_to_prototypes
+from benchmarks.synthetic import make_student_gallery, make_student_queries
+
+
+def time_frames(match, frames):
+    """Runs 'match' on each frame and returns (ids, per-frame latencies in ms)."""
+    ids, latencies = [], []
+    for frame in frames:
+        start = time.perf_counter()
+        ids.append(match(frame)[0])
+        latencies.append((time.perf_counter() - start) * 1000.0)
+    return np.concatenate(ids), np.array(latencies)
+
+
+def run(students, photos, appearances, prototypes, faces_per_frame, n_frames, tolerance):
+    gallery, owners, looks = make_student_gallery(students, photos, appearances)
+    queries, truth = make_student_queries(looks, faces_per_frame * n_frames)
+    frames = np.split(queries, n_frames)
+    names = [f'Student {o}' for o in owners]
+
+    raw_norms = squared_norms(gallery)
+
+    def match_photos(frame):
+        best, distances = brute_force_search(gallery, raw_norms, frame)
+        return np.where(distances <= tolerance, owners[best], -1), distances
+
+    print(f"{students} students x {photos} photos, {appearances} looks each, {queries.shape[0]} live faces")
+    print(f"{'gallery':>10} {'rows':>9} {'build s':>8} {'accuracy':>9} {'agree':>7} {'p50 ms':>9} {'p99 ms':>9}")
+
+    baseline, lat = time_frames(match_photos, frames)
+    accuracy = float(np.mean(baseline == truth))
+    print(f"{'photos':>10} {gallery.shape[0]:>9} {'-':>8} {accuracy:>9.4f} {1.0:>7.4f} "
+          f"{np.percentile(lat, 50):>9.3f} {np.percentile(lat, 99):>9.3f}")
+
+    for k in [0] + list(prototypes):
+        start = time.perf_counter()
+        encodings, student_ids, _ = reduce_to_prototypes(gallery, owners, names, k)
+        build_seconds = time.perf_counter() - start
+        sq_norms = squared_norms(encodings)
+
+        ids, lat = time_frames(lambda f: match_students(encodings, sq_norms, student_ids, f, tolerance), frames)
+        label = 'segmin' if k == 0 else f'medoids/{k}'
+        print(f"{label:>10} {encodings.shape[0]:>9} {build_seconds:>8.2f} {float(np.mean(ids == truth)):>9.4f} "
+              f"{float(np.mean(ids == baseline)):>7.4f} {np.percentile(lat, 50):>9.3f} {np.percentile(lat, 99):>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--photos', type=int, default=10, help='Enrolled photos per student.')
+    parser.add_argument('--appearances', type=int, default=2, help='Distinct looks per student.')
+    parser.add_argument('--prototypes', type=int, nargs='+', default=[1, 2, 3])
+    parser.add_argument('--faces-per-frame', type=int, default=30)
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--tolerance', type=float, default=0.5)
+    args = parser.parse_args()
+    run(args.students, args.photos, args.appearances, args.prototypes,
+        args.faces_per_frame, args.frames, args.tolerance)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+"""
+Offline benchmark suite for the recognition, enrollment and reporting hot paths.
+
+Everything runs on synthetic data in a temporary directory; no camera or
+network is needed. Run from the project root:
+
+    python -m benchmarks.suite run --gallery-size 20000 --out bench.json
+    python -m benchmarks.suite compare baseline.json bench.json --threshold 0.15
+
+'run' measures latency percentiles and throughput per stage and writes
+them as JSON. 'compare' flags stages whose p50 or p99 grew by more than the
+threshold against a saved baseline and exits with status 1 if any did.
+
+Stages:
+    decode, detect, encode   Per-frame image work (needs face_recognition).
+                             Frames are synthetic unless --images points at
+                             a folder of real photos.
+    match, match_ivf         Matching one frame of live faces against the gallery.
+    db_write                 Queuing and flushing a class worth of attendance marks.
+    cache_reload_db          load_known_faces from the database.
+    cache_reload_mmap        load_known_faces from the memory-mapped snapshot file.
+    reports, export_csv      /api/reports and the streamed CSV export over the history.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+from datetime import date
+import numpy as np
+from benchmarks import synthetic
+
+ALL_STAGES = [
+    'decode', 'detect', 'encode', 'match', 'match_ivf',
+    'db_write', 'cache_reload_db', 'cache_reload_mmap', 'reports', 'export_csv'
+]
+
+
+# --- Measurement ---
+
+def measure(fn, repeat, warmup=1, items=1):
+    """
+    Calls fn() warmup + repeat times and summarises the timed calls.
+
+    'items' is how many units of work one call does (frames, marks, rows);
+    throughput is reported in items per second.
+    """
+    for _ in range(warmup):
+        fn()
+
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000.0)
+
+    lat = np.array(latencies)
+    return {
+        'n': repeat,
+        'mean_ms': float(lat.mean()),
+        'p50_ms': float(np.percentile(lat, 50)),
+        'p95_ms': float(np.percentile(lat, 95)),
+        'p99_ms': float(np.percentile(lat, 99)),
+        'throughput_per_s': float(items * 1000.0 / lat.mean()) if lat.mean() > 0 else None
+    }
+
+
+def cycle(items):
+    """Endless iterator over a list, so repeated calls see different inputs."""
+    while True:
+        yield from items
+
+
+# --- Stages ---
+
+def bench_image_stages(stages, args, results):
+    import cv2
+    import face_recognition
+    from config import config
+    from models.face_recognition_model import detect_faces
+
+    if args.images:
+        frames = []
+        for name in sorted(os.listdir(args.images)):
+            with open(os.path.join(args.images, name), 'rb') as f:
+                frames.append(f.read())
+    else:
+        frames = synthetic.make_frames(8)
+
+    decoded = [cv2.cvtColor(cv2.imdecode(np.frombuffer(b, np.uint8), cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+               for b in frames]
+
+    if 'decode' in stages:
+        it = cycle(frames)
+        results['decode'] = measure(lambda: cv2.imdecode(np.frombuffer(next(it), np.uint8), cv2.IMREAD_COLOR), args.repeat)
+
+    if 'detect' in stages:
+        it = cycle(decoded)
+        results['detect'] = measure(lambda: detect_faces(
+            next(it), scale=config.DETECTION_SCALE, model=config.DETECTION_MODEL, upsample=config.DETECTION_UPSAMPLE
+        ), args.repeat)
+
+    if 'encode' in stages:
+        # Real photos are encoded at their detected boxes; synthetic frames
+        # at a fixed central box, which costs the same
+        work = []
+        for img in decoded:
+            boxes = face_recognition.face_locations(img) if args.images else []
+            if not boxes:
+                h, w = img.shape[:2]
+                boxes = [(h // 4, 3 * w // 4, 3 * h // 4, w // 4)]
+            work.append((img, boxes))
+        it = cycle(work)
+
+        def encode():
+            img, boxes = next(it)
+            face_recognition.face_encodings(img, boxes)
+        results['encode'] = measure(encode, args.repeat)
+
+
+def bench_match(stages, args, results):
+    from models.gallery_index import IVFIndex, brute_force_search, squared_norms
+
+    gallery, centers = synthetic.make_gallery(args.gallery_size, args.photos_per_student)
+    sq_norms = squared_norms(gallery)
+    frames = np.split(synthetic.make_queries(centers, args.faces_per_frame * 16), 16)
+
+    if 'match' in stages:
+        it = cycle(frames)
+        results['match'] = measure(lambda: brute_force_search(gallery, sq_norms, next(it)),
+                                   args.repeat, items=args.faces_per_frame)
+
+    if 'match_ivf' in stages:
+        index = IVFIndex.build(gallery)
+        it = cycle(frames)
+        results['match_ivf'] = measure(lambda: index.search(gallery, sq_norms, next(it)),
+                                       args.repeat, items=args.faces_per_frame)
+
+
+def bench_app_stages(stages, args, results, workdir):
+    # Config reads the environment at import time, so point it at the
+    # temporary directory before the app is imported
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'GALLERY_SNAPSHOT_PATH': os.path.join(workdir, 'gallery.bin'),
+        'RECOGNITION_WORKERS': '0',
+        'ENROLLMENT_WORKERS': '1'
+    })
+    from app import app
+    from database import db, Attendance
+    from cache import load_known_faces
+    from attendance_writer import AttendanceMarker
+
+    n_students = max(1, args.gallery_size // args.photos_per_student)
+    with app.app_context():
+        rows = synthetic.populate_database(db, n_students, args.photos_per_student, args.history_days)
+    print(f"Synthetic database: {n_students} students, {args.gallery_size} faces, {rows} attendance rows")
+
+    snapshot_path = app.config['GALLERY_SNAPSHOT_PATH']
+
+    def reload_from_db():
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+        with app.app_context():
+            load_known_faces()
+
+    def reload_from_file():
+        with app.app_context():
+            load_known_faces()
+
+    if 'cache_reload_db' in stages:
+        results['cache_reload_db'] = measure(reload_from_db, max(3, args.repeat // 10), items=args.gallery_size)
+    if 'cache_reload_mmap' in stages:
+        reload_from_db()
+        results['cache_reload_mmap'] = measure(reload_from_file, max(3, args.repeat // 10), items=args.gallery_size)
+
+    if 'db_write' in stages:
+        # A class of students marked per round; each round deletes today's
+        # rows so the next round writes the same number of new ones
+        class_size = min(args.faces_per_frame, n_students)
+        marker = AttendanceMarker(app, flush_interval=3600)
+
+        def mark_class():
+            with app.app_context():
+                # Forces a day roll-over, which re-seeds the marked set from the DB
+                marker._day = None
+                for pk in range(1, class_size + 1):
+                    marker.mark(pk)
+                marker.flush()
+                db.session.execute(Attendance.__table__.delete().where(Attendance.date == date.today()))
+                db.session.commit()
+        results['db_write'] = measure(mark_class, max(5, args.repeat // 5), items=class_size)
+
+    client = app.test_client()
+    today = time.strftime('%Y-%m-%d')
+    start = time.strftime('%Y-%m-%d', time.localtime(time.time() - args.history_days * 86400))
+    query = f"start_date={start}&end_date={today}"
+
+    if 'reports' in stages:
+        results['reports'] = measure(lambda: client.get(f'/api/reports?{query}').get_data(),
+                                     max(3, args.repeat // 10), items=n_students)
+    if 'export_csv' in stages:
+        results['export_csv'] = measure(lambda: client.get(f'/api/reports/export?{query}').get_data(),
+                                        max(3, args.repeat // 10), items=rows)
+
+
+# --- Commands ---
+
+def run(args):
+    stages = set(args.stages or ALL_STAGES)
+    results = {}
+
+    with tempfile.TemporaryDirectory(prefix='face-bench-') as workdir:
+        if stages & {'decode', 'detect', 'encode'}:
+            bench_image_stages(stages, args, results)
+        if stages & {'match', 'match_ivf'}:
+            bench_match(stages, args, results)
+        if stages & {'db_write', 'cache_reload_db', 'cache_reload_mmap', 'reports', 'export_csv'}:
+            bench_app_stages(stages, args, results, workdir)
+
+    report = {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'gallery_size': args.gallery_size,
+            'photos_per_student': args.photos_per_student,
+            'faces_per_frame': args.faces_per_frame,
+            'history_days': args.history_days,
+            'repeat': args.repeat
+        },
+        'results': results
+    }
+
+    print(f"{'stage':<18} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'items/s':>12}")
+    for stage in ALL_STAGES:
+        if stage in results:
+            r = results[stage]
+            print(f"{stage:<18} {r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} {r['p99_ms']:>9.3f} {r['throughput_per_s'] or 0:>12.1f}")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.out}")
+    return 0
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    with open(args.current) as f:
+        current = json.load(f)['results']
+
+    regressions = 0
+    print(f"{'stage':<18} {'p50 base':>9} {'p50 now':>9} {'change':>8} {'p99 change':>11}")
+    for stage in ALL_STAGES:
+        if stage not in baseline or stage not in current:
+            continue
+        base, now = baseline[stage], current[stage]
+        p50_change = now['p50_ms'] / base['p50_ms'] - 1.0 if base['p50_ms'] else 0.0
+        p99_change = now['p99_ms'] / base['p99_ms'] - 1.0 if base['p99_ms'] else 0.0
+        regressed = p50_change > args.threshold or p99_change > args.threshold
+        regressions += regressed
+        flag = '  REGRESSION' if regressed else ''
+        print(f"{stage:<18} {base['p50_ms']:>9.3f} {now['p50_ms']:>9.3f} {p50_change:>+8.1%} {p99_change:>+11.1%}{flag}")
+
+    if regressions:
+        print(f"{regressions} stage(s) regressed by more than {args.threshold:.0%}.")
+        return 1
+    print("No regressions.")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Run the benchmarks.')
+    run_parser.add_argument('--stages', nargs='+', choices=ALL_STAGES, help='Stages to run (default: all).')
+    run_parser.add_argument('--gallery-size', type=int, default=10000, help='Number of face encodings.')
+    run_parser.add_argument('--photos-per-student', type=int, default=5)
+    run_parser.add_argument('--faces-per-frame', type=int, default=30)
+    run_parser.add_argument('--history-days', type=int, default=60, help='Days of synthetic attendance.')
+    run_parser.add_argument('--repeat', type=int, default=50, help='Timed iterations per stage.')
+    run_parser.add_argument('--images', help='Folder of face photos for the image stages.')
+    run_parser.add_argument('--out', help='Write results to this JSON file.')
+
+    compare_parser = commands.add_parser('compare', help='Compare results against a baseline.')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.15,
+                                help='Relative slowdown that counts as a regression.')
+
+    args = parser.parse_args()
+    sys.exit(run(args) if args.command == 'run' else compare(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Synthetic data shared by the benchmarks: galleries of random 128-d
+encodings, camera-like frames and a populated SQLite database.
+"""
+import random
+from datetime import date, datetime, timedelta
+import numpy as np
+
+# Per-dimension spread of synthetic identities and of photos around them.
+# Chosen so different people are ~1.1 apart and photos of one person ~0.25,
+# similar to real dlib encodings.
+IDENTITY_SCALE = 0.07
+PHOTO_NOISE = 0.02
+# Spread of a student's distinct looks around their identity (~0.35 apart)
+APPEARANCE_SCALE = 0.022
+
+
+def make_gallery(size, photos_per_student=5, dim=128, seed=0):
+    """Returns an (size x dim) float32 gallery and the identity centers used to make it."""
+    rng = np.random.default_rng(seed)
+    n_students = max(1, size // photos_per_student)
+    centers = rng.normal(0.0, IDENTITY_SCALE, (n_students, dim)).astype(np.float32)
+    owners = np.arange(size) % n_students
+    gallery = centers[owners] + rng.normal(0.0, PHOTO_NOISE, (size, dim)).astype(np.float32)
+    return np.ascontiguousarray(gallery), centers
+
+
+def make_queries(centers, n_queries, dim=128, seed=1):
+    """Live encodings: fresh photos of randomly chosen enrolled students."""
+    rng = np.random.default_rng(seed)
+    picked = centers[rng.integers(0, centers.shape[0], n_queries)]
+    return (picked + rng.normal(0.0, PHOTO_NOISE, (n_queries, dim))).astype(np.float32)
+
+
+def make_student_gallery(n_students, photos_per_student, appearances=2, dim=128, seed=0):
+    """
+    Gallery where every student has several distinct looks (glasses,
+    lighting, ...), each a small offset from their identity.
+
+    Returns:
+        A tuple (gallery, owners, looks): (N x dim) encodings, the owning
+        student index of each row, and the (students x appearances x dim)
+        look centers for make_student_queries.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0.0, IDENTITY_SCALE, (n_students, 1, dim))
+    looks = (centers + rng.normal(0.0, APPEARANCE_SCALE, (n_students, appearances, dim))).astype(np.float32)
+
+    owners = np.repeat(np.arange(n_students), photos_per_student)
+    picked = looks[owners, np.arange(owners.size) % appearances]
+    gallery = picked + rng.normal(0.0, PHOTO_NOISE, picked.shape).astype(np.float32)
+    return np.ascontiguousarray(gallery), owners, looks
+
+
+def make_student_queries(looks, n_queries, seed=1):
+    """Live encodings of random students in random looks; returns (queries, true owners)."""
+    rng = np.random.default_rng(seed)
+    owners = rng.integers(0, looks.shape[0], n_queries)
+    picked = looks[owners, rng.integers(0, looks.shape[1], n_queries)]
+    return (picked + rng.normal(0.0, PHOTO_NOISE, picked.shape)).astype(np.float32), owners
+
+
+def make_frames(count, width=640, height=480, seed=2):
+    """
+    JPEG-encoded camera-sized frames: smooth gradients plus noise, so the
+    decoder and detector do realistic amounts of work.
+    """
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    ys, xs = np.mgrid[0:height, 0:width]
+    frames = []
+    for _ in range(count):
+        base = (xs * rng.uniform(0.1, 0.4) + ys * rng.uniform(0.1, 0.4)) % 256
+        img = np.dstack([base, np.roll(base, 40, axis=1), np.roll(base, 80, axis=0)])
+        img = np.clip(img + rng.normal(0, 12, img.shape), 0, 255).astype(np.uint8)
+        frames.append(cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes())
+    return frames
+
+
+def populate_database(db, n_students, photos_per_student, history_days, presence=0.8, seed=3):
+    """
+    Fills the app's database with students, random face encodings and
+    'history_days' days of attendance ending yesterday, so marks made
+    today are all new. Needs an app context.
+    """
+    from database import Student, Face, Attendance, bump_gallery_version
+
+    rng = random.Random(seed)
+    gallery, _ = make_gallery(n_students * photos_per_student, photos_per_student, seed=seed)
+
+    db.session.execute(db.insert(Student.__table__), [
+        {'student_id': f'S{i:06d}', 'name': f'Student {i}', 'email': None, 'created_at': datetime.utcnow()}
+        for i in range(1, n_students + 1)
+    ])
+    # Row i of the gallery belongs to student (i % n_students) + 1
+    db.session.execute(db.insert(Face.__table__), [
+        {'filename': f'synthetic_{i}.jpg', 'encoding': gallery[i], 'student_id': (i % n_students) + 1}
+        for i in range(gallery.shape[0])
+    ])
+
+    today = date.today()
+    rows = []
+    for day in range(history_days):
+        d = today - timedelta(days=day + 1)
+        for pk in range(1, n_students + 1):
+            if rng.random() < presence:
+                rows.append({
+                    'student_id': pk, 'date': d, 'status': 'present',
+                    'timestamp': datetime.combine(d, datetime.min.time()) + timedelta(seconds=rng.randint(28800, 36000))
+                })
+    if rows:
+        db.session.execute(db.insert(Attendance.__table__), rows)
+
+    bump_gallery_version()
+    db.session.commit()
+    return len(rows)
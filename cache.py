@@ -1,39 +1,433 @@
+import time
+import threading
+from contextlib import contextmanager
+import numpy as np
 from flask import current_app
-from database import db, Student, Face
+from database import db, Student, Face, Group, group_members, ENCODING_DIM, get_gallery_version
+from config import config
+from gallery_file import read_snapshot_file, write_snapshot_file, snapshot_file_stamp, snapshot_file_lock
+from models.gallery_index import IVFIndex, squared_norms
+from models.prototypes import reduce_to_prototypes
+from metrics import metrics, record_stage, timed
+
+
+class GallerySnapshot:
+    """
+    Read-only view of every known face encoding.
+
+    The encodings live in one contiguous (N x 128) float32 matrix together
+    with their precomputed squared norms, so a whole frame of live faces can
+    be matched with a single matrix product. Row i of 'encodings' belongs to
+    student_ids[i] / names[i]. With config.GALLERY_PROTOTYPES set, a student's
+    rows are a few medoid photos instead of every enrolled photo.
+
+    Snapshots are never modified after publication; every change produces a
+    new snapshot with a higher version, so a recognition that grabbed one
+    keeps a consistent view until it finishes.
+
+    Large galleries also carry an IVFIndex ('index') for approximate search;
+    it is None below config.ANN_MIN_GALLERY_SIZE.
+
+    'groups' maps every group id to the student ids on its roster; see
+    roster_view() for matching against one group only.
+    """
+
+    def __init__(self, encodings, sq_norms, student_ids, names, version=0, index=None, groups=None):
+        self.encodings = encodings
+        self.sq_norms = sq_norms
+        self.student_ids = student_ids
+        self.names = names
+        self.version = version
+        self.index = index
+        self.groups = groups if groups is not None else {}
+        self._roster_views = {}
+
+    def __len__(self):
+        return self.encodings.shape[0]
+
+    def roster_view(self, group_id):
+        """
+        Returns the rows of one group's students as a contiguous
+        sub-gallery (encodings, sq_norms, rows), where rows maps sub-gallery
+        rows back to rows of this snapshot.
+
+        Returns None when the group holds more than
+        config.GROUP_GALLERY_MAX_FRACTION of the gallery; matching such a
+        group against the whole gallery (and its index) is as cheap and
+        saves the copy. Views are built on first use and kept for the
+        lifetime of the snapshot.
+        """
+        if group_id in self._roster_views:
+            return self._roster_views[group_id]
+
+        members = self.groups.get(group_id, np.empty(0, dtype=np.int64))
+        rows = np.nonzero(np.isin(self.student_ids, members))[0]
+        if len(self) and rows.size > config.GROUP_GALLERY_MAX_FRACTION * len(self):
+            view = None
+        else:
+            view = (np.ascontiguousarray(self.encodings[rows]), self.sq_norms[rows], rows)
+        self._roster_views[group_id] = view
+        return view
+
+    @classmethod
+    def empty(cls, version=0):
+        return cls(
+            np.empty((0, ENCODING_DIM), dtype=np.float32),
+            np.empty(0, dtype=np.float32),
+            np.empty(0, dtype=np.int64),
+            [],
+            version
+        )
+
+    @classmethod
+    def from_rows(cls, encodings, student_ids, names, version=0):
+        """
+        Builds a snapshot from parallel sequences of encodings, student
+        primary keys and names.
+        """
+        matrix = np.empty((len(encodings), ENCODING_DIM), dtype=np.float32)
+        for i, enc in enumerate(encodings):
+            matrix[i] = enc
+
+        sq_norms = squared_norms(matrix)
+        return cls(matrix, sq_norms, np.asarray(student_ids, dtype=np.int64), list(names), version)
+
+
+def _build_index(encodings):
+    """Builds an IVF index when the gallery is large enough to benefit from one."""
+    if encodings.shape[0] < config.ANN_MIN_GALLERY_SIZE:
+        return None
+    return IVFIndex.build(encodings, nlist=config.ANN_NLIST, nprobe=config.ANN_NPROBE)
+
+
+class FaceGallery:
+    """
+    Holder of the current GallerySnapshot.
+
+    Writers build a new snapshot (copy-on-write) under a lock and publish it
+    with a single reference swap, so readers never need to lock.
+
+    Once attached to a snapshot file, the gallery is shared by every worker
+    process on the host: each one memory-maps the same file, so the
+    encodings exist once in the page cache, and refresh() maps a newer file
+    published by another worker.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = GallerySnapshot.empty()
+        self.path = None
+        self._file_stamp = None
+
+    @property
+    def snapshot(self) -> GallerySnapshot:
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def attach(self, path):
+        """Backs the gallery with the shared snapshot file at 'path'."""
+        self.path = path
+
+    def refresh(self):
+        """
+        Maps the snapshot file if a new one was published since it was last
+        mapped. Costs a single stat() when nothing changed, so it is cheap
+        enough to call on every request.
+        """
+        if self.path is not None and snapshot_file_stamp(self.path) != self._file_stamp:
+            self.map_file()
+
+    def map_file(self, expected_version=None) -> bool:
+        """
+        Memory-maps the snapshot file and publishes it, unless it is older
+        than the current snapshot. Returns False if the file is missing,
+        unreadable, not at 'expected_version' or holds encodings of
+        another config.ENCODING_VERSION.
+        """
+        # Stamped before reading: if the file is replaced in between, the
+        # newer content is mapped and the next refresh() maps it once more
+        stamp = snapshot_file_stamp(self.path)
+        mapped = read_snapshot_file(self.path, expected_version, config.GALLERY_PROTOTYPES, config.ENCODING_VERSION)
+        if mapped is None:
+            return False
+
+        *arrays, groups, ivf, version = mapped
+        with self._lock:
+            self._file_stamp = stamp
+            old = self._snapshot
+            if version < old.version:
+                return True
+
+            snapshot = GallerySnapshot(*arrays, version=version, groups=groups)
+            if ivf is not None:
+                # The writer's cells; rows are read from the shared mapping
+                snapshot.index = IVFIndex(*ivf, nprobe=config.ANN_NPROBE)
+            elif version == old.version and old.index is not None:
+                # Same content; only the backing memory changes
+                snapshot.index = old.index
+            elif old.index is not None and len(snapshot) >= config.ANN_MIN_GALLERY_SIZE:
+                snapshot.index = old.index.reassigned(snapshot.encodings)
+            else:
+                snapshot.index = _build_index(snapshot.encodings)
+            self._snapshot = snapshot
+        return True
+
+    def save(self):
+        """Publishes the current snapshot to the attached file for the other workers."""
+        if self.path is None:
+            return
+        try:
+            write_snapshot_file(self.path, self._snapshot, config.GALLERY_PROTOTYPES, config.ENCODING_VERSION)
+        except OSError as e:
+            current_app.logger.warning(f'Could not write gallery snapshot {self.path}: {e}')
+
+    def publish(self, snapshot: GallerySnapshot):
+        """
+        Publishes a complete new gallery, e.g. after a full database reload.
+        A gallery that gets an index is stored in cell order, so every cell
+        can be scanned in place.
+        """
+        if snapshot.index is None:
+            index = _build_index(snapshot.encodings)
+            if index is not None:
+                order, index = index.cell_order()
+                snapshot = GallerySnapshot(
+                    np.ascontiguousarray(snapshot.encodings[order]),
+                    snapshot.sq_norms[order],
+                    snapshot.student_ids[order],
+                    [snapshot.names[i] for i in order],
+                    snapshot.version,
+                    index,
+                    snapshot.groups
+                )
+        with self._lock:
+            self._snapshot = snapshot
+
+    def replace(self, encodings, student_ids, names, version=None, groups=None):
+        """Builds a snapshot from parallel rows (and group rosters) and publishes it."""
+        if version is None:
+            version = self._snapshot.version + 1
+        snapshot = GallerySnapshot.from_rows(encodings, student_ids, names, version)
+        snapshot.groups = groups if groups is not None else {}
+        self.publish(snapshot)
+
+    def add(self, student_pk: int, name: str, encodings):
+        """
+        Appends the encodings of one student to the gallery, reduced to
+        config.GALLERY_PROTOTYPES prototypes if that is set.
+        """
+        if len(encodings) == 0:
+            return
+
+        matrix = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        matrix, ids, names = reduce_to_prototypes(matrix, [student_pk] * len(matrix), [name] * len(matrix),
+                                                  config.GALLERY_PROTOTYPES)
+        added = GallerySnapshot.from_rows(matrix, ids, names)
+        with self._lock:
+            old = self._snapshot
+            encodings = np.concatenate([old.encodings, added.encodings])
+            if old.index is not None:
+                # New rows are assigned to the existing cells; no retraining
+                index = old.index.with_added(encodings, len(added))
+            else:
+                index = _build_index(encodings)
+
+            self._snapshot = GallerySnapshot(
+                encodings,
+                np.concatenate([old.sq_norms, added.sq_norms]),
+                np.concatenate([old.student_ids, added.student_ids]),
+                old.names + added.names,
+                old.version + 1,
+                index,
+                old.groups
+            )
+
+    def remove(self, student_pk: int):
+        """Drops every encoding that belongs to one student, and them from every group."""
+        with self._lock:
+            old = self._snapshot
+            keep = old.student_ids != student_pk
+            groups = {gid: members[members != student_pk] for gid, members in old.groups.items()}
+            if keep.all():
+                self._snapshot = self._with_groups(old, groups)
+                return
+
+            encodings = np.ascontiguousarray(old.encodings[keep])
+            self._snapshot = GallerySnapshot(
+                encodings,
+                old.sq_norms[keep],
+                old.student_ids[keep],
+                [n for n, k in zip(old.names, keep) if k],
+                old.version + 1,
+                old.index.with_kept(keep) if old.index is not None else None,
+                groups
+            )
+
+    def set_group(self, group_id: int, student_pks):
+        """Sets the roster of one group, creating it if needed."""
+        with self._lock:
+            groups = dict(self._snapshot.groups)
+            groups[group_id] = np.unique(np.asarray(student_pks, dtype=np.int64))
+            self._snapshot = self._with_groups(self._snapshot, groups)
+
+    def delete_group(self, group_id: int):
+        with self._lock:
+            groups = {gid: members for gid, members in self._snapshot.groups.items() if gid != group_id}
+            self._snapshot = self._with_groups(self._snapshot, groups)
+
+    @staticmethod
+    def _with_groups(old, groups):
+        # Rows and index are shared; only the rosters (and views) change
+        return GallerySnapshot(
+            old.encodings, old.sq_norms, old.student_ids, old.names,
+            old.version + 1, old.index, groups
+        )
+
+
+# In-memory cache for face encodings. Always read it through get_known_faces()
+# so callers see the snapshot published by the latest change.
+face_gallery = FaceGallery()
+
+
+def get_known_faces() -> GallerySnapshot:
+    """
+    Returns the currently published gallery snapshot, first picking up a
+    snapshot another worker process published since the last call.
+    """
+    face_gallery.refresh()
+    return face_gallery.snapshot
+
+
+@contextmanager
+def gallery_update():
+    """
+    Serializes gallery changes across worker processes. Wrap the commit that
+    bumps the gallery version together with the matching face_gallery.add()
+    or remove() call in it:
+
+        with gallery_update():
+            bump_gallery_version()
+            db.session.commit()
+            face_gallery.add(student.id, student.name, encodings)
+
+    On entry the gallery is brought up to the database's version, so the
+    incremental change lands on the latest gallery. On a clean exit the
+    result is written to the snapshot file, where the other workers pick it
+    up on their next request. Needs the app context.
+    """
+    with snapshot_file_lock(face_gallery.path):
+        face_gallery.refresh()
+        # Rows the caller already added to the session must not be loaded
+        # here, or its incremental change would apply them twice
+        with db.session.no_autoflush:
+            db_version = get_gallery_version()
+            if face_gallery.version != db_version:
+                # Changed without an incremental update, e.g. by 'flask faces import'
+                _load_from_database(db_version)
+        yield face_gallery
+        face_gallery.save()
 
-# In-memory cache for face encodings
-known_faces_cache = {
-    'encodings': [],
-    'student_ids': [],
-    'names': []
-}
 
 def load_known_faces():
     """
-    Loads all face encodings from the database into the global 'known_faces_cache'.
+    Loads all face encodings into the global gallery.
     This function needs the app context to query the database.
+
+    If the snapshot file at GALLERY_SNAPSHOT_PATH matches the database's
+    gallery version it is memory-mapped instead of querying every face;
+    otherwise the gallery is loaded from the database and the file rebuilt.
+
+    Enrollment and deletion update the gallery incrementally through
+    gallery_update(), so this full reload is only needed at startup or
+    after bulk changes.
     """
-    global known_faces_cache
     print("Reloading known faces cache...")
-    
+    started = time.perf_counter()
+
     # We use current_app.app_context() to ensure we can access the database
     with current_app.app_context():
+        snapshot_path = current_app.config['GALLERY_SNAPSHOT_PATH']
+        face_gallery.attach(snapshot_path)
+
+        # Workers starting together wait for the first one to write the file
+        with snapshot_file_lock(snapshot_path):
+            db_version = get_gallery_version()
+
+            with timed('cache_reload', 'read_file'):
+                mapped = face_gallery.map_file(expected_version=db_version)
+            if mapped:
+                _record_reload('mmap', started)
+                print(f"Cache mapped from {snapshot_path}. Total encodings: {len(face_gallery.snapshot)} (version {db_version})")
+                return
+
+            _load_from_database(db_version)
+
+        _record_reload('database', started)
+        print(f"Cache reloaded. Total encodings: {len(face_gallery.snapshot)} (version {db_version})")
+
+
+def _load_from_database(db_version):
+    """
+    Rebuilds the gallery from the Face rows and rewrites the snapshot file.
+    Only encodings of the configured ENCODING_VERSION are loaded, since
+    live faces are encoded with that version's settings.
+    """
+    with timed('cache_reload', 'query'):
         known_faces = db.session.query(
-            Face.encoding, 
-            Student.id, 
+            Face.encoding,
+            Student.id,
             Student.name
-        ).join(Student, Face.student_id == Student.id).all()
-        
+        ).join(Student, Face.student_id == Student.id).filter(
+            Face.encoding_version == config.ENCODING_VERSION
+        ).all()
+
+        skipped = db.session.query(Face.id).filter(Face.encoding_version != config.ENCODING_VERSION).count()
+        if skipped:
+            print(f"Skipped {skipped} face encodings not at encoding version {config.ENCODING_VERSION}; "
+                  "run 'flask faces reencode'.")
+
+        groups = {group_id: [] for (group_id,) in db.session.query(Group.id)}
+        for group_id, student_pk in db.session.query(group_members.c.group_id, group_members.c.student_id):
+            groups[group_id].append(student_pk)
+        groups = {gid: np.unique(np.asarray(members, dtype=np.int64)) for gid, members in groups.items()}
+
+    with timed('cache_reload', 'build'):
         if known_faces:
             # Unzip the query results into separate lists
             encodings, student_ids, names = zip(*known_faces)
-            known_faces_cache = {
-                'encodings': list(encodings),
-                'student_ids': list(student_ids),
-                'names': list(names)
-            }
+            # Rows are grouped by student, optionally compressed to prototypes
+            encodings, student_ids, names = reduce_to_prototypes(
+                np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM),
+                student_ids, names, config.GALLERY_PROTOTYPES
+            )
+            face_gallery.replace(encodings, student_ids, names, version=db_version, groups=groups)
         else:
             # Ensure cache is empty if database is empty
-            known_faces_cache = {'encodings': [], 'student_ids': [], 'names': []}
-            
-        print(f"Cache reloaded. Total encodings: {len(known_faces_cache['encodings'])}")
\ No newline at end of file
+            face_gallery.replace([], [], [], version=db_version, groups=groups)
+
+    with timed('cache_reload', 'write'):
+        face_gallery.save()
+
+
+def _record_reload(source, started):
+    seconds = time.perf_counter() - started
+    record_stage('cache_reload', 'total', seconds)
+    metrics.set_gauge('face_gallery_reload_seconds', seconds)
+    metrics.set_gauge('face_gallery_reload_timestamp_seconds', time.time())
+    metrics.set_gauge('face_gallery_reload_from_mmap', int(source == 'mmap'))
+
+
+def _gallery_metrics():
+    snapshot = face_gallery.snapshot
+    yield 'face_gallery_size', 'gauge', len(snapshot), {}
+    yield 'face_gallery_students', 'gauge', len(np.unique(snapshot.student_ids)), {}
+    yield 'face_gallery_version', 'gauge', snapshot.version, {}
+    yield 'face_gallery_groups', 'gauge', len(snapshot.groups), {}
+    yield 'face_gallery_indexed', 'gauge', int(snapshot.index is not None), {}
+
+
+metrics.describe('face_gallery_reload_seconds', 'Duration of the last full gallery reload.')
+metrics.add_collector(_gallery_metrics)
@@ -0,0 +1,366 @@
+import os
+import csv
+import json
+import time
+import zipfile
+from datetime import datetime
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy.exc import IntegrityError
+from werkzeug.utils import secure_filename
+from database import db, Student, Face, PendingEncoding, bump_gallery_version
+from cache import load_known_faces
+from recognition_engine import warm_up_models
+from models.face_recognition_model import allowed_file, encode_face_from_bytes
+from models.face_quality import LowQualityFace, quality_settings
+
+faces_cli = AppGroup('faces', help='Face gallery maintenance commands.')
+
+
+# --- Photo Sources ---
+
+class PhotoSource:
+    """
+    Photos of a roster, from a directory or a zip archive.
+
+    Every photo belongs to at most one student: the one its folder is named
+    after, otherwise the one whose student_id is the longest '_'-separated
+    prefix of its file name (e.g. S123.jpg, S123_2.jpg). Photos matching no
+    roster student_id are ignored.
+    """
+
+    def __init__(self, path, student_ids):
+        self.path = path
+        self.zip = zipfile.ZipFile(path) if zipfile.is_zipfile(path) else None
+
+        if self.zip is not None:
+            names = [n for n in self.zip.namelist() if not n.endswith('/')]
+        else:
+            names = [
+                os.path.relpath(os.path.join(root, f), path)
+                for root, _, files in os.walk(path) for f in files
+            ]
+
+        roster = set(student_ids)
+        self.by_student = {}
+        for name in sorted(names):
+            if not allowed_file(os.path.basename(name)):
+                continue
+            owner = self._owner(name, roster)
+            if owner is not None:
+                self.by_student.setdefault(owner, []).append(name)
+
+    @staticmethod
+    def _owner(name, roster):
+        """Returns the roster student_id a photo belongs to, or None."""
+        folder = os.path.basename(os.path.dirname(name))
+        if folder in roster:
+            return folder
+        parts = os.path.splitext(os.path.basename(name))[0].split('_')
+        # Longest prefix first, so S1_0_1.jpg goes to S1_0 rather than S1
+        for i in range(len(parts), 0, -1):
+            key = '_'.join(parts[:i])
+            if key in roster:
+                return key
+        return None
+
+    def photos_for(self, student_id):
+        return self.by_student.get(student_id, [])
+
+    def read(self, name):
+        if self.zip is not None:
+            return self.zip.read(name)
+        with open(os.path.join(self.path, name), 'rb') as f:
+            return f.read()
+
+
+# --- Checkpoint ---
+
+def _load_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {'done': [], 'failures': []}
+
+def _save_checkpoint(path, checkpoint):
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+# --- Worker ---
+
+def _encode_photo(data, quality=None):
+    """Runs in a worker process. Returns (encoding, error)."""
+    try:
+        return encode_face_from_bytes(data, quality), None
+    except LowQualityFace as e:
+        return None, f'low quality face ({e.reason})'
+    except Exception as e:
+        return None, str(e)
+
+def _reencode_photo(path):
+    """Runs in a worker process. Re-encodes a stored photo; returns (encoding, error)."""
+    try:
+        with open(path, 'rb') as f:
+            enc = encode_face_from_bytes(f.read())
+    except Exception as e:
+        return None, str(e)[:256]
+    return (enc, None) if enc is not None else (None, 'no face found')
+
+
+# --- Import Command ---
+
+@faces_cli.command('import')
+@click.argument('roster', type=click.Path(exists=True, dir_okay=False))
+@click.argument('photos', type=click.Path(exists=True))
+@click.option('--workers', type=int, default=0, help='Encoding processes (0 = one per CPU core).')
+@click.option('--batch-size', type=int, default=100, show_default=True,
+              help='Students inserted per transaction and checkpoint.')
+@click.option('--checkpoint', type=click.Path(dir_okay=False), default=None,
+              help='Progress file; defaults to ROSTER.checkpoint.json. Rerun with the same file to resume.')
+@click.option('--report', type=click.Path(dir_okay=False), default=None,
+              help='Write the failure report to this CSV file.')
+def import_roster(roster, photos, workers, batch_size, checkpoint, report):
+    """
+    Bulk-enrolls students from a ROSTER CSV (student_id,name,email) and a
+    PHOTOS directory or zip archive.
+    """
+    checkpoint_path = checkpoint or f"{roster}.checkpoint.json"
+    state = _load_checkpoint(checkpoint_path)
+    done = set(state['done'])
+
+    with open(roster, newline='', encoding='utf-8-sig') as f:
+        rows = {}
+        for r in csv.DictReader(f):
+            if r.get('student_id') and r.get('name'):
+                # First row wins if a student_id appears twice
+                rows.setdefault(r['student_id'], r)
+        rows = list(rows.values())
+
+    existing = {sid for (sid,) in db.session.query(Student.student_id)}
+    pending = [r for r in rows if r['student_id'] not in done and r['student_id'] not in existing]
+    click.echo(f"{len(rows)} students in roster, {len(rows) - len(pending)} already imported, {len(pending)} to go.")
+
+    source = PhotoSource(photos, [r['student_id'] for r in rows])
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    workers = workers if workers > 0 else (os.cpu_count() or 1)
+    quality = quality_settings(current_app.config)
+
+    started = time.perf_counter()
+    images_done = 0
+    students_added = 0
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm_up_models) as pool:
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            jobs = [(r, name) for r in batch for name in source.photos_for(r['student_id'])]
+            datas = [source.read(name) for _, name in jobs]
+            results = list(pool.map(_encode_photo, datas, repeat(quality), chunksize=4))
+
+            per_student = {}
+            for (row, name), data, (enc, error) in zip(jobs, datas, results):
+                if error is not None or enc is None:
+                    state['failures'].append({
+                        'student_id': row['student_id'], 'photo': name,
+                        'reason': error or 'no face found'
+                    })
+                    continue
+                per_student.setdefault(row['student_id'], []).append((name, data, enc))
+
+            files_to_write = []
+            for row in batch:
+                faces = per_student.get(row['student_id'])
+                if not faces:
+                    state['failures'].append({
+                        'student_id': row['student_id'], 'photo': '',
+                        'reason': 'no usable photos; student not created'
+                    })
+                    continue
+
+                # One savepoint per student, so a conflicting email fails only
+                # that student instead of the whole batch
+                student_files = []
+                try:
+                    with db.session.begin_nested():
+                        s = Student(student_id=row['student_id'], name=row['name'], email=row.get('email') or None)
+                        db.session.add(s)
+                        db.session.flush() # Assigns s.id for the filenames
+                        for name, data, enc in faces:
+                            filename = secure_filename(f"{s.id}_{s.student_id}_{datetime.utcnow().timestamp()}_{os.path.basename(name)}")
+                            db.session.add(Face(filename=filename, encoding=enc, student=s))
+                            student_files.append((filename, data))
+                except IntegrityError:
+                    state['failures'].append({
+                        'student_id': row['student_id'], 'photo': '',
+                        'reason': 'student ID or email already in use; student not created'
+                    })
+                    continue
+                files_to_write.extend(student_files)
+                students_added += 1
+
+            bump_gallery_version()
+            db.session.commit()
+
+            for filename, data in files_to_write:
+                with open(os.path.join(upload_folder, filename), 'wb') as f:
+                    f.write(data)
+
+            state['done'].extend(r['student_id'] for r in batch)
+            _save_checkpoint(checkpoint_path, state)
+
+            images_done += len(jobs)
+            elapsed = time.perf_counter() - started
+            click.echo(f"  {start + len(batch)}/{len(pending)} students, "
+                       f"{images_done} images, {images_done / max(elapsed, 1e-9):.1f} images/sec")
+
+    # One cache rebuild for the whole import
+    load_known_faces()
+
+    elapsed = time.perf_counter() - started
+    click.echo(f"Imported {students_added} students from {images_done} images in {elapsed:.1f}s "
+               f"({images_done / max(elapsed, 1e-9):.1f} images/sec).")
+
+    failures = state['failures']
+    if failures:
+        click.echo(f"{len(failures)} failures:")
+        for failure in failures[:20]:
+            click.echo(f"  {failure['student_id']} {failure['photo']}: {failure['reason']}")
+        if len(failures) > 20:
+            click.echo(f"  ... and {len(failures) - 20} more")
+
+    if report:
+        with open(report, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['student_id', 'photo', 'reason'])
+            writer.writeheader()
+            writer.writerows(failures)
+        click.echo(f"Failure report written to {report}")
+
+
+# --- Re-encode Command ---
+
+def _switch_encodings(target):
+    """
+    Copies the staged encodings into faces, drops the staging rows and
+    bumps the gallery version, all in one transaction.
+
+    Returns:
+        The number of faces switched to the target version.
+    """
+    staged = db.session.execute(
+        db.select(PendingEncoding.face_id, PendingEncoding.encoding)
+        .join(Face, Face.id == PendingEncoding.face_id)
+        .where(PendingEncoding.encoding_version == target, PendingEncoding.encoding.is_not(None))
+    ).all()
+
+    if staged:
+        db.session.execute(
+            db.update(Face),
+            [{'id': face_id, 'encoding': enc, 'encoding_version': target} for face_id, enc in staged]
+        )
+    db.session.execute(db.delete(PendingEncoding))
+    bump_gallery_version()
+    db.session.commit()
+    return len(staged)
+
+@faces_cli.command('reencode')
+@click.option('--workers', type=int, default=0, help='Encoding processes (0 = one per CPU core).')
+@click.option('--chunk-size', type=int, default=200, show_default=True,
+              help='Faces encoded per transaction.')
+@click.option('--force', is_flag=True,
+              help='Switch even if some photos could not be re-encoded; those faces leave the gallery.')
+def reencode_gallery(workers, chunk_size, force):
+    """
+    Re-encodes every stored face photo whose encoding is older than
+    ENCODING_VERSION, e.g. after changing ENCODING_MODEL or
+    ENCODING_NUM_JITTERS. Run it with the new settings.
+
+    New encodings are staged and committed per chunk, so an interrupted
+    run resumes where it stopped. The live gallery keeps the old encodings
+    until every face has been processed; then all of them are switched in
+    one transaction and the cache is rebuilt.
+
+    If any photo fails, nothing is switched unless --force is given. The
+    gallery only loads encodings of the configured ENCODING_VERSION, so
+    faces left at an older version are not matched.
+
+    The web processes must be restarted with the new ENCODING_* settings
+    when the switch happens: until then they encode live faces with the
+    old settings and compare them against the new gallery. Faces they
+    enroll with the old settings are picked up by running this again.
+    """
+    target = current_app.config['ENCODING_VERSION']
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    workers = workers if workers > 0 else (os.cpu_count() or 1)
+
+    # Keep finished work for this version; retry failures and drop work for other versions
+    db.session.execute(db.delete(PendingEncoding).where(
+        (PendingEncoding.encoding_version != target) | PendingEncoding.encoding.is_(None)
+    ))
+    db.session.commit()
+
+    staged = db.session.scalar(db.select(db.func.count()).select_from(PendingEncoding))
+    click.echo(f"Re-encoding faces to version {target}; {staged} already done by an earlier run.")
+
+    started = time.perf_counter()
+    images_done = 0
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm_up_models) as pool:
+        # Repeat until nothing is left, to catch faces enrolled while the job ran
+        while True:
+            todo = db.session.execute(
+                db.select(Face.id, Face.filename)
+                .outerjoin(PendingEncoding, PendingEncoding.face_id == Face.id)
+                .where(Face.encoding_version != target, PendingEncoding.face_id.is_(None))
+                .order_by(Face.id)
+            ).all()
+            if not todo:
+                break
+
+            for start in range(0, len(todo), chunk_size):
+                chunk = todo[start:start + chunk_size]
+                paths = [os.path.join(upload_folder, filename) for _, filename in chunk]
+                results = pool.map(_reencode_photo, paths, chunksize=4)
+
+                for (face_id, _), (enc, error) in zip(chunk, results):
+                    db.session.add(PendingEncoding(
+                        face_id=face_id, encoding_version=target, encoding=enc, error=error
+                    ))
+                db.session.commit()
+
+                images_done += len(chunk)
+                elapsed = time.perf_counter() - started
+                click.echo(f"  {start + len(chunk)}/{len(todo)} faces, "
+                           f"{images_done / max(elapsed, 1e-9):.1f} images/sec")
+
+    failures = db.session.execute(
+        db.select(PendingEncoding.face_id, Face.filename, PendingEncoding.error)
+        .join(Face, Face.id == PendingEncoding.face_id)
+        .where(PendingEncoding.encoding.is_(None))
+    ).all()
+
+    if failures:
+        click.echo(f"{len(failures)} faces could not be re-encoded:")
+        for face_id, filename, error in failures[:20]:
+            click.echo(f"  face {face_id} {filename}: {error}")
+        if len(failures) > 20:
+            click.echo(f"  ... and {len(failures) - 20} more")
+        if not force:
+            # Staged encodings are kept; a rerun only retries the failures
+            raise click.ClickException("Nothing was switched. Fix or delete these photos and run again, "
+                                       "or pass --force to switch without them.")
+        click.echo("They keep their old encoding and are left out of the gallery; re-enroll these students.")
+
+    switched = _switch_encodings(target)
+    load_known_faces()
+
+    elapsed = time.perf_counter() - started
+    click.echo(f"Switched {switched} faces to encoding version {target} "
+               f"({images_done} encoded in this run, {elapsed:.1f}s). "
+               "Restart the web processes with the new encoding settings now.")
@@ -13,6 +13,10 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', f'sqlite:///{BASE_DIR / "data" / "attendance.db"}')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Memory-mapped copy of the face gallery shared by all worker processes on
+    # the host; rebuilt when the database's gallery version changes
+    GALLERY_SNAPSHOT_PATH = os.getenv('GALLERY_SNAPSHOT_PATH', str(BASE_DIR / 'data' / 'gallery.bin'))
+
     # --- File Upload Settings ---
     # Folder where student face images will be stored
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', str(BASE_DIR / 'static' / 'uploads'))
@@ -20,5 +24,115 @@ class Config:
     # Allowed file extensions for face images
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 
+    # --- Enrollment Settings ---
+    # Worker processes encoding registration images (-1 = one per CPU core)
+    ENROLLMENT_WORKERS = int(os.getenv('ENROLLMENT_WORKERS', -1))
+    # Seconds a finished enrollment job stays queryable
+    ENROLLMENT_JOB_TTL = int(os.getenv('ENROLLMENT_JOB_TTL', 3600))
+
+    # --- Face Detection Settings ---
+    # Detection runs on a copy of the frame resized by this factor (1.0 = full resolution);
+    # boxes are mapped back to full resolution before encoding
+    DETECTION_SCALE = float(os.getenv('DETECTION_SCALE', 0.5))
+    # face_recognition detector: 'hog' (CPU) or 'cnn' (needs a GPU to be practical)
+    DETECTION_MODEL = os.getenv('DETECTION_MODEL', 'hog')
+    # How many times the detector upsamples the image to find smaller faces
+    DETECTION_UPSAMPLE = int(os.getenv('DETECTION_UPSAMPLE', 1))
+    # Uploaded frames larger than this (longest side, in pixels) are resized first; 0 disables
+    MAX_INPUT_DIMENSION = int(os.getenv('MAX_INPUT_DIMENSION', 1280))
+
+    # --- Face Encoding Settings ---
+    # Version stored with every gallery encoding. Bump it after changing the
+    # settings below, then run 'flask faces reencode' to rebuild the gallery
+    ENCODING_VERSION = int(os.getenv('ENCODING_VERSION', 1))
+    # dlib landmark model used to align faces before encoding: 'small' (5 points) or 'large' (68 points)
+    ENCODING_MODEL = os.getenv('ENCODING_MODEL', 'small')
+    # Times an enrolled photo is re-sampled and averaged when encoded (slower, slightly more accurate)
+    ENCODING_NUM_JITTERS = int(os.getenv('ENCODING_NUM_JITTERS', 1))
+
+    # --- Face Quality Settings ---
+    # Newly detected faces are checked before encoding; faces failing a check are
+    # reported as low quality (recognition) or discarded (enrollment)
+    FACE_QUALITY_GATING = os.getenv('FACE_QUALITY_GATING', '1').lower() in ('1', 'true', 'yes')
+    # Minimum face box side, in pixels of the (resized) frame
+    FACE_MIN_SIZE = int(os.getenv('FACE_MIN_SIZE', 40))
+    # Minimum Laplacian variance of the face crop scaled to 64x64; lower is blurrier
+    FACE_MIN_SHARPNESS = float(os.getenv('FACE_MIN_SHARPNESS', 20.0))
+    # Accepted mean brightness (0-255) of the face crop
+    FACE_MIN_BRIGHTNESS = float(os.getenv('FACE_MIN_BRIGHTNESS', 40))
+    FACE_MAX_BRIGHTNESS = float(os.getenv('FACE_MAX_BRIGHTNESS', 225))
+
+    # --- Recognition Engine Settings ---
+    # Worker processes for detection/encoding (-1 = one per CPU core, 0 = run inline)
+    RECOGNITION_WORKERS = int(os.getenv('RECOGNITION_WORKERS', -1))
+    # Frames allowed to wait for a free worker before new ones get a 503
+    RECOGNITION_QUEUE_SIZE = int(os.getenv('RECOGNITION_QUEUE_SIZE', 4))
+    # Seconds a frame may wait and run before it is dropped
+    RECOGNITION_TIMEOUT = float(os.getenv('RECOGNITION_TIMEOUT', 5.0))
+    # Value of the Retry-After header sent with 503 responses
+    RECOGNITION_RETRY_AFTER = int(os.getenv('RECOGNITION_RETRY_AFTER', 1))
+
+    # --- Face Tracking Settings ---
+    # Frames that carry a camera_id are tracked across frames: a face overlapping
+    # a known track by at least this IoU reuses its encoding and identity
+    TRACKING_IOU_THRESHOLD = float(os.getenv('TRACKING_IOU_THRESHOLD', 0.5))
+    # Tracked faces are re-encoded for verification every this many frames
+    TRACKING_REENCODE_INTERVAL = int(os.getenv('TRACKING_REENCODE_INTERVAL', 10))
+    # Tracks are dropped after this many frames without a matching detection
+    TRACKING_MAX_MISSED = int(os.getenv('TRACKING_MAX_MISSED', 3))
+    # Seconds without frames after which a camera's tracking state is discarded
+    CAMERA_SESSION_TTL = float(os.getenv('CAMERA_SESSION_TTL', 300))
+
+    # --- Motion Gating Settings ---
+    # Tracked cameras skip frames where nothing moved and search only changed regions
+    MOTION_GATING = os.getenv('MOTION_GATING', '1').lower() in ('1', 'true', 'yes')
+    # Per-pixel brightness change (0-255) on the 1/8 thumbnail that counts as motion
+    MOTION_PIXEL_THRESHOLD = int(os.getenv('MOTION_PIXEL_THRESHOLD', 25))
+    # Below this fraction of changed thumbnail pixels the frame counts as static
+    MOTION_MIN_CHANGED_FRACTION = float(os.getenv('MOTION_MIN_CHANGED_FRACTION', 0.002))
+    # If changed regions cover more than this fraction of the frame, search all of it
+    MOTION_MAX_REGION_FRACTION = float(os.getenv('MOTION_MAX_REGION_FRACTION', 0.5))
+    # Changed regions are grown by this fraction of their size on each side
+    MOTION_REGION_PADDING = float(os.getenv('MOTION_REGION_PADDING', 0.5))
+    # A full-frame search is forced after this many gated frames
+    MOTION_FULL_INTERVAL = int(os.getenv('MOTION_FULL_INTERVAL', 30))
+
+    # --- Attendance Settings ---
+    # New attendance marks are queued and written in batches at this interval (seconds)
+    ATTENDANCE_FLUSH_INTERVAL = float(os.getenv('ATTENDANCE_FLUSH_INTERVAL', 1.0))
+    # Queue length that triggers an early flush
+    ATTENDANCE_FLUSH_BATCH = int(os.getenv('ATTENDANCE_FLUSH_BATCH', 100))
+    # Seconds between checks for marks made by other processes when
+    # answering conditional polls of today's attendance
+    ATTENDANCE_SYNC_INTERVAL = float(os.getenv('ATTENDANCE_SYNC_INTERVAL', 5.0))
+
+    # --- Face Matching Settings ---
+    # Galleries with at least this many encodings are searched through an
+    # approximate IVF index instead of a full scan
+    ANN_MIN_GALLERY_SIZE = int(os.getenv('ANN_MIN_GALLERY_SIZE', 20000))
+    # Number of IVF cells (0 = about sqrt(gallery size)) and cells scanned per face
+    ANN_NLIST = int(os.getenv('ANN_NLIST', 0))
+    ANN_NPROBE = int(os.getenv('ANN_NPROBE', 8))
+    # Medoid prototypes kept per student (0 = one row per enrolled photo).
+    # 2-3 shrink the gallery several-fold; see benchmarks/prototype_benchmark.py
+    GALLERY_PROTOTYPES = int(os.getenv('GALLERY_PROTOTYPES', 0))
+    # Groups (rosters) holding more than this fraction of the gallery are
+    # matched against the whole gallery, keeping only their members' matches
+    GROUP_GALLERY_MAX_FRACTION = float(os.getenv('GROUP_GALLERY_MAX_FRACTION', 0.5))
+
+    # --- Startup Settings ---
+    # Recognition workers always start and load the models at startup, and
+    # /readyz waits for them; this also runs one dummy inference in each
+    RECOGNITION_WARMUP = os.getenv('RECOGNITION_WARMUP', '0').lower() in ('1', 'true', 'yes')
+
+    # --- Streaming Settings ---
+    # Largest JPEG frame accepted on the /ws/recognize channel
+    STREAM_MAX_FRAME_BYTES = int(os.getenv('STREAM_MAX_FRAME_BYTES', 2 * 1024 * 1024))
+
+    # --- Metrics Settings ---
+    # Requests slower than this many milliseconds are logged with their
+    # per-stage breakdown (0 disables the slow-request log)
+    SLOW_REQUEST_THRESHOLD_MS = float(os.getenv('SLOW_REQUEST_THRESHOLD_MS', 0))
+
 # Create a single config instance to be imported by the app
 config = Config()
\ No newline at end of file
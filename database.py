@@ -1,9 +1,53 @@
+import pickle
+import numpy as np
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
+from sqlalchemy.types import TypeDecorator, LargeBinary
 from datetime import datetime, date
+from config import config
 
 # Initialize the SQLAlchemy database object
 db = SQLAlchemy()
 
+# Dimension of a dlib face encoding and its size as a raw float32 BLOB
+ENCODING_DIM = 128
+ENCODING_BYTES = ENCODING_DIM * 4
+
+def decode_encoding(blob):
+    """
+    Turns a stored encoding back into a float32 numpy array.
+    Rows written before the switch to raw BLOBs hold a pickled array instead.
+    """
+    if len(blob) == ENCODING_BYTES:
+        return np.frombuffer(blob, dtype=np.float32)
+    return np.asarray(pickle.loads(blob), dtype=np.float32)
+
+class FaceEncoding(TypeDecorator):
+    """
+    Column type storing a 128d face encoding as a raw 512-byte float32 BLOB.
+    """
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return np.asarray(value, dtype=np.float32).tobytes()
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return decode_encoding(value)
+
+# Many-to-many link between students and the groups (classes, sections)
+# they are enrolled in
+group_members = db.Table(
+    'group_members',
+    db.Column('group_id', db.Integer, db.ForeignKey('groups.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('student_id', db.Integer, db.ForeignKey('students.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_group_members_student', 'student_id')
+)
+
 class Student(db.Model):
     """
     Model for storing student information.
@@ -24,6 +68,8 @@ class Student(db.Model):
     # --- FIX: Changed 'Relationship' to 'relationship' (lowercase 'r') ---
     attendances = db.relationship('Attendance', backref='student', lazy=True, cascade='all, delete-orphan')
 
+    groups = db.relationship('Group', secondary=group_members, back_populates='students', lazy=True)
+
     def __repr__(self):
         return f'<Student {self.name} ({self.student_id})>'
 
@@ -37,6 +83,34 @@ class Student(db.Model):
             'created_at': self.created_at.isoformat()
         }
 
+class Group(db.Model):
+    """
+    Model for a roster of students, e.g. a class or section. Cameras can
+    restrict recognition to one group's students.
+    """
+    __tablename__ = 'groups'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(128), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    students = db.relationship('Student', secondary=group_members, back_populates='groups', lazy=True)
+
+    def __repr__(self):
+        return f'<Group {self.name}>'
+
+    def to_dict(self, include_students=False):
+        """Returns a dictionary representation of the group."""
+        data = {
+            'id': self.id,
+            'name': self.name,
+            'member_count': len(self.students),
+            'created_at': self.created_at.isoformat()
+        }
+        if include_students:
+            data['students'] = [s.to_dict() for s in self.students]
+        return data
+
 class Face(db.Model):
     """
     Model for storing individual face encodings for each student.
@@ -45,8 +119,10 @@ class Face(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(256), nullable=False)
-    # PickleType is used to store the numpy array (face encoding)
-    encoding = db.Column(db.PickleType, nullable=False)
+    # Raw float32 bytes of the numpy array (face encoding)
+    encoding = db.Column(FaceEncoding, nullable=False)
+    # ENCODING_VERSION (model and parameters) the encoding was computed with
+    encoding_version = db.Column(db.Integer, default=lambda: config.ENCODING_VERSION, nullable=False)
     
     # --- Foreign Key ---
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
@@ -54,6 +130,39 @@ class Face(db.Model):
     def __repr__(self):
         return f'<Face {self.filename} for Student ID {self.student_id}>'
 
+class PendingEncoding(db.Model):
+    """
+    A face re-encoded for a new encoding version by 'flask faces reencode'.
+    Rows are staged here chunk by chunk and copied into faces in one
+    transaction when the job completes; a failed face has no encoding.
+    """
+    __tablename__ = 'pending_encodings'
+
+    face_id = db.Column(db.Integer, db.ForeignKey('faces.id', ondelete='CASCADE'), primary_key=True)
+    encoding_version = db.Column(db.Integer, nullable=False)
+    encoding = db.Column(FaceEncoding, nullable=True)
+    error = db.Column(db.String(256), nullable=True)
+
+class EnrollmentRecord(db.Model):
+    """
+    Progress of a registration encoded in the background, stored so that
+    every server worker can answer polls for it, not only the one doing
+    the work. 'images' holds the per-image states reported by the job API.
+    """
+    __tablename__ = 'enrollment_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)
+    student_id = db.Column(db.String(64), nullable=False, index=True)
+    name = db.Column(db.String(128), nullable=False)
+    status = db.Column(db.String(16), nullable=False)
+    message = db.Column(db.String(256), nullable=True)
+    # Set once the student is created; not a foreign key, the student may be deleted later
+    student_pk = db.Column(db.Integer, nullable=True)
+    images = db.Column(db.JSON, nullable=False)
+    # Unix timestamps, as kept by the in-memory job
+    created_at = db.Column(db.Float, nullable=False)
+    finished_at = db.Column(db.Float, nullable=True)
+
 class Attendance(db.Model):
     """
     Model for storing attendance records.
@@ -67,10 +176,16 @@ class Attendance(db.Model):
     
     # --- Foreign Key ---
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
+    # Group whose camera marked the student, if the camera was scoped to one
+    group_id = db.Column(db.Integer, db.ForeignKey('groups.id', ondelete='SET NULL'), nullable=True)
     
     # --- Constraints ---
-    # Ensures a student can only be marked present once per day
-    __table_args__ = (db.UniqueConstraint('date', 'student_id', name='_date_student_uc'),)
+    # Ensures a student can only be marked present once per day; the second
+    # index serves per-student date-range lookups used by the reports
+    __table_args__ = (
+        db.UniqueConstraint('date', 'student_id', name='_date_student_uc'),
+        db.Index('ix_attendances_student_date', 'student_id', 'date'),
+    )
 
     def __repr__(self):
         return f'<Attendance {self.student.name} on {self.date}>'
@@ -83,5 +198,70 @@ class Attendance(db.Model):
             'name': self.student.name if self.student else None,
             'timestamp': self.timestamp.isoformat(),
             'date': self.date.isoformat(),
-            'status': self.status
-        }
\ No newline at end of file
+            'status': self.status,
+            'group_id': self.group_id
+        }
+
+class GalleryState(db.Model):
+    """
+    Single-row table whose version is bumped whenever faces are added or
+    removed, so cached copies of the gallery can tell they are stale.
+    """
+    __tablename__ = 'gallery_state'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+def get_gallery_version() -> int:
+    """Returns the current gallery version stored in the database."""
+    # Always read from the database; the session's identity map may hold
+    # a row from before another process bumped the version
+    version = db.session.scalar(db.select(GalleryState.version).where(GalleryState.id == 1))
+    return version or 0
+
+def bump_gallery_version():
+    """Increments the gallery version as part of the current transaction."""
+    db.session.execute(
+        db.update(GalleryState).where(GalleryState.id == 1).values(version=GalleryState.version + 1)
+    )
+
+def upgrade_database():
+    """
+    Brings an existing database up to date after db.create_all().
+
+    - Creates indexes and columns added to existing tables; existing faces
+      get encoding version 1.
+    - Creates the gallery_state row.
+    - Rewrites face encodings still stored as pickles into raw float32 BLOBs.
+    """
+    for index in Attendance.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+
+    attendance_columns = {c['name'] for c in db.inspect(db.engine).get_columns('attendances')}
+    if 'group_id' not in attendance_columns:
+        db.session.execute(text('ALTER TABLE attendances ADD COLUMN group_id INTEGER REFERENCES groups(id)'))
+
+    face_columns = {c['name'] for c in db.inspect(db.engine).get_columns('faces')}
+    if 'encoding_version' not in face_columns:
+        # Existing encodings were all computed with the original settings
+        db.session.execute(text('ALTER TABLE faces ADD COLUMN encoding_version INTEGER NOT NULL DEFAULT 1'))
+
+    if db.session.get(GalleryState, 1) is None:
+        db.session.add(GalleryState(id=1, version=0))
+
+    legacy_rows = db.session.execute(
+        text('SELECT id, encoding FROM faces WHERE length(encoding) != :size'),
+        {'size': ENCODING_BYTES}
+    ).all()
+
+    for face_id, blob in legacy_rows:
+        db.session.execute(
+            text('UPDATE faces SET encoding = :blob WHERE id = :id'),
+            {'blob': decode_encoding(blob).tobytes(), 'id': face_id}
+        )
+
+    if legacy_rows:
+        print(f"Migrated {len(legacy_rows)} pickled face encodings to float32 BLOBs.")
+        bump_gallery_version()
+
+    db.session.commit()
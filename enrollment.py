@@ -0,0 +1,312 @@
+import os
+import time
+import uuid
+import threading
+from sqlalchemy.exc import IntegrityError
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from database import db, Student, Face, EnrollmentRecord, bump_gallery_version
+from cache import face_gallery, gallery_update
+from recognition_engine import warm_up_models
+from models.face_recognition_model import encode_face_from_bytes
+from models.face_quality import LowQualityFace, quality_settings
+from metrics import metrics, record_stage, timed
+
+# Per-image states reported by the job API
+PENDING = 'pending'
+ENCODED = 'encoded'
+NO_FACE = 'no_face'
+LOW_QUALITY = 'low_quality'
+ERROR = 'error'
+
+
+def _encode_upload(data, quality=None):
+    """
+    Runs in a worker process. Returns (encoding or None, encode_seconds).
+    Raises LowQualityFace if the photo's faces fail the quality gate.
+    """
+    start = time.perf_counter()
+    enc = encode_face_from_bytes(data, quality)
+    return enc, time.perf_counter() - start
+
+
+class EnrollmentJob:
+    """
+    Progress of one student's registration while their images are encoded.
+    The student only gets a primary key ('student_pk') once the job is done.
+    """
+
+    def __init__(self, student_id, name, email, filenames):
+        self.id = uuid.uuid4().hex
+        self.student_pk = None
+        self.student_id = student_id
+        self.name = name
+        self.email = email
+        self.status = 'running'
+        self.message = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.images = [{'filename': f, 'status': PENDING, 'error': None} for f in filenames]
+
+    def to_dict(self):
+        """Returns a dictionary representation of the job."""
+        done = sum(1 for img in self.images if img['status'] != PENDING)
+        return {
+            'id': self.id,
+            'student_pk': self.student_pk,
+            'student_id': self.student_id,
+            'name': self.name,
+            'status': self.status,
+            'message': self.message,
+            'progress': {'done': done, 'total': len(self.images)},
+            'images': self.images
+        }
+
+    @classmethod
+    def from_record(cls, record):
+        """Rebuilds a job started by another server worker from its EnrollmentRecord."""
+        job = cls(record.student_id, record.name, None, [])
+        job.id = record.id
+        job.student_pk = record.student_pk
+        job.status = record.status
+        job.message = record.message
+        job.created_at = record.created_at
+        job.finished_at = record.finished_at
+        job.images = record.images
+        return job
+
+
+class EnrollmentManager:
+    """
+    Encodes registration images in parallel on a process pool and finishes
+    each registration in the background.
+
+    Images are decoded straight from the upload bytes. The Student row is
+    created together with its Face rows in one transaction when the job
+    finishes, so a crash mid-job never leaves a student without faces.
+    Only images with a face are written to UPLOAD_FOLDER, on a separate
+    I/O thread pool, once that transaction is committed.
+
+    Job state is also written to the enrollment_jobs table as it changes,
+    so a poll answered by any server worker sees it. Finished jobs are kept
+    for 'job_ttl' seconds so clients can read their result; a job still
+    running after that long is assumed lost with the process running it.
+    """
+
+    def __init__(self, app, workers=None, job_ttl=3600, quality=None):
+        self.app = app
+        self.workers = (os.cpu_count() or 1) if workers is None else max(1, workers)
+        self.job_ttl = job_ttl
+        self.quality = quality
+
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='enrollment-io')
+
+    def _get_pool(self):
+        # Created on first use so each forked server worker gets its own pool
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_up_models)
+            return self._pool
+
+    def _discard_pool(self, pool):
+        """Drops a broken pool (a worker died) so the next job starts a fresh one."""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def get(self, job_id):
+        """
+        Returns the job with this id, from this process or, for jobs run by
+        another server worker, from the database. Needs the app context.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+
+        record = db.session.get(EnrollmentRecord, job_id)
+        if record is None:
+            return None
+        job = EnrollmentJob.from_record(record)
+        if job.status == 'running' and time.time() - job.created_at > self.job_ttl:
+            job.status = 'failed'
+            job.message = 'Registration was interrupted. Please register the student again.'
+        return job
+
+    def in_progress(self, student_id):
+        """True if a running job in any server worker is registering 'student_id'."""
+        cutoff = time.time() - self.job_ttl
+        return db.session.scalar(
+            db.select(EnrollmentRecord.id).where(
+                EnrollmentRecord.student_id == student_id,
+                EnrollmentRecord.status == 'running',
+                EnrollmentRecord.created_at >= cutoff
+            ).limit(1)
+        ) is not None
+
+    def _store(self, job):
+        """Writes the job's current state to the database for the other workers."""
+        try:
+            db.session.merge(EnrollmentRecord(
+                id=job.id,
+                student_id=job.student_id,
+                name=job.name,
+                status=job.status,
+                message=job.message[:256] if job.message else None,
+                student_pk=job.student_pk,
+                images=[dict(img) for img in job.images],
+                created_at=job.created_at,
+                finished_at=job.finished_at
+            ))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self.app.logger.error(f'Could not store enrollment job {job.id}: {e}')
+
+    def submit(self, student_id, name, email, uploads):
+        """
+        Starts registering a new student from their uploaded images.
+        Needs the app context.
+
+        Args:
+            student_id, name, email: The new Student's fields.
+            uploads: A list of (filename, image_bytes) pairs.
+
+        Returns:
+            The EnrollmentJob tracking the work.
+        """
+        job = EnrollmentJob(student_id, name, email, [f for f, _ in uploads])
+        now = time.time()
+        with self._lock:
+            expired = [jid for jid, j in self._jobs.items()
+                       if j.finished_at is not None and now - j.finished_at > self.job_ttl]
+            for jid in expired:
+                del self._jobs[jid]
+            self._jobs[job.id] = job
+
+        db.session.execute(db.delete(EnrollmentRecord).where(
+            db.func.coalesce(EnrollmentRecord.finished_at, EnrollmentRecord.created_at) < now - self.job_ttl
+        ))
+        self._store(job)
+
+        pool = self._get_pool()
+        try:
+            futures = [pool.submit(_encode_upload, data, self.quality) for _, data in uploads]
+        except BrokenProcessPool:
+            # A worker died since the last job; retry once on a fresh pool
+            self._discard_pool(pool)
+            pool = self._get_pool()
+            futures = [pool.submit(_encode_upload, data, self.quality) for _, data in uploads]
+
+        threading.Thread(
+            target=self._finish, args=(job, uploads, futures, pool),
+            name=f'enrollment-{job.id[:8]}', daemon=True
+        ).start()
+        return job
+
+    def _image_done(self, job, i, future, pool):
+        image = job.images[i]
+        try:
+            enc, seconds = future.result()
+            record_stage('enroll', 'encode', seconds)
+            image['status'] = NO_FACE if enc is None else ENCODED
+        except LowQualityFace as e:
+            metrics.inc('face_quality_rejected_total', path='enroll', reason=e.reason)
+            image['status'] = LOW_QUALITY
+            image['error'] = e.reason
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self._discard_pool(pool)
+            image['status'] = ERROR
+            image['error'] = str(e)
+
+    def _save_file(self, filename, data):
+        filepath = os.path.join(self.app.config['UPLOAD_FOLDER'], filename)
+        try:
+            with open(filepath, 'wb') as f:
+                f.write(data)
+        except OSError as e:
+            self.app.logger.error(f'Could not save image {filename}: {e}')
+
+    def _finish(self, job, uploads, futures, pool):
+        encodings = []
+        saved = []
+        with self.app.app_context():
+            # Progress is stored per image so polls on other workers see it
+            index = {future: i for i, future in enumerate(futures)}
+            for future in as_completed(futures):
+                self._image_done(job, index[future], future, pool)
+                self._store(job)
+            record_stage('enroll', 'wait', time.time() - job.created_at)
+
+            try:
+                student = Student(name=job.name, student_id=job.student_id, email=job.email)
+
+                for (filename, data), future in zip(uploads, futures):
+                    error = future.exception()
+                    if isinstance(error, LowQualityFace):
+                        self.app.logger.warning(f'Low quality face in {filename} ({error.reason}), image discarded.')
+                        continue
+                    if error is not None:
+                        self.app.logger.error(f'Error processing image {filename}: {error}')
+                        continue
+
+                    enc, _ = future.result()
+                    if enc is None:
+                        self.app.logger.warning(f'No face found in {filename}, image discarded.')
+                        continue
+
+                    student.faces.append(Face(filename=filename, encoding=enc))
+                    encodings.append(enc)
+                    saved.append((filename, data))
+
+                if not encodings:
+                    # Nothing was written, so there is no student to roll back
+                    job.status = 'failed'
+                    job.message = 'Registration failed. No valid faces detected in uploaded images.'
+                else:
+                    with timed('enroll', 'commit'), gallery_update():
+                        db.session.add(student)
+                        bump_gallery_version()
+                        db.session.commit()
+                        # Only the new encodings are appended; no full reload needed
+                        face_gallery.add(student.id, student.name, encodings)
+                    job.student_pk = student.id
+                    # Disk writes stay off the critical path
+                    for filename, data in saved:
+                        self._io_pool.submit(self._save_file, filename, data)
+                    job.status = 'done'
+                    job.message = f'{len(encodings)} of {len(uploads)} images enrolled.'
+            except IntegrityError:
+                db.session.rollback()
+                job.status = 'failed'
+                job.message = f'Student ID {job.student_id} or email {job.email} already exists.'
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f'Enrollment job {job.id} failed: {e}')
+                job.status = 'failed'
+                job.message = str(e)
+            finally:
+                job.finished_at = time.time()
+                self._store(job)
+
+
+def init_enrollment_manager(app):
+    """Creates the app's EnrollmentManager from its config."""
+    workers = app.config['ENROLLMENT_WORKERS']
+    manager = EnrollmentManager(
+        app,
+        workers=None if workers < 0 else workers,
+        job_ttl=app.config['ENROLLMENT_JOB_TTL'],
+        quality=quality_settings(app.config)
+    )
+    app.extensions['enrollment_manager'] = manager
+    return manager
+
+
+def get_enrollment_manager(app) -> EnrollmentManager:
+    return app.extensions['enrollment_manager']
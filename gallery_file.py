@@ -0,0 +1,154 @@
+import os
+import json
+import struct
+from contextlib import contextmanager
+import numpy as np
+from database import ENCODING_DIM
+
+# On-disk gallery snapshot layout (little endian):
+#   header (64 bytes): magic, format, db version, row count, dim, names length,
+#                      prototypes per student (0 = every photo), groups length,
+#                      IVF cells (0 = no index), encoding version of the rows
+#   encodings:  count x dim float32, in IVF cell order when there is an index
+#   sq_norms:   count float32
+#   student_ids: count int64
+#   centroids:  cells x dim float32
+#   labels:     count int32, the IVF cell of every row (only with an index)
+#   names:      UTF-8 JSON list, 'names length' bytes
+#   groups:     UTF-8 JSON object of group id -> member student ids, 'groups length' bytes
+MAGIC = b'FGAL'
+FORMAT_VERSION = 5
+HEADER = struct.Struct('<4sIQQIQIQII')
+HEADER_SIZE = 64
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development server only
+    fcntl = None
+
+
+def write_snapshot_file(path, snapshot, prototypes=0, encoding_version=0):
+    """
+    Writes a GallerySnapshot to 'path', with its IVF index if it has one,
+    so every worker maps the same cells instead of building its own.
+
+    The file is written next to the target and renamed into place, so
+    processes that already mapped the previous file keep a valid view.
+    """
+    names = json.dumps(snapshot.names).encode('utf-8')
+    groups = json.dumps({str(gid): [int(pk) for pk in members] for gid, members in snapshot.groups.items()}).encode('utf-8')
+    count = len(snapshot)
+    index = snapshot.index
+    cells = index.nlist if index is not None else 0
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, snapshot.version, count, ENCODING_DIM, len(names), prototypes, len(groups), cells, encoding_version).ljust(HEADER_SIZE, b'\0'))
+        f.write(np.ascontiguousarray(snapshot.encodings, dtype=np.float32).tobytes())
+        f.write(np.asarray(snapshot.sq_norms, dtype=np.float32).tobytes())
+        f.write(np.asarray(snapshot.student_ids, dtype=np.int64).tobytes())
+        if index is not None:
+            f.write(np.asarray(index.centroids, dtype=np.float32).tobytes())
+            f.write(np.asarray(index.labels, dtype=np.int32).tobytes())
+        f.write(names)
+        f.write(groups)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot_file(path, expected_version=None, expected_prototypes=0, expected_encoding_version=0):
+    """
+    Memory-maps a snapshot file written by write_snapshot_file.
+
+    Returns a tuple (encodings, sq_norms, student_ids, names, groups, ivf, version)
+    whose arrays are read-only memmaps, where ivf is (centroids, labels) or
+    None for a gallery without an index. Returns None if the file is missing, malformed
+    or was built for a different database version than 'expected_version'
+    (any version is accepted when it is None), a different prototype
+    setting than 'expected_prototypes' or encodings of another version than
+    'expected_encoding_version'.
+    """
+    try:
+        with open(path, 'rb') as f:
+            magic, fmt, version, count, dim, names_len, prototypes, groups_len, cells, encoding_version = HEADER.unpack(f.read(HEADER_SIZE)[:HEADER.size])
+            if magic != MAGIC or fmt != FORMAT_VERSION or dim != ENCODING_DIM or prototypes != expected_prototypes:
+                return None
+            if encoding_version != expected_encoding_version:
+                return None
+            if expected_version is not None and version != expected_version:
+                return None
+
+            index_offset = HEADER_SIZE + count * (dim * 4 + 4 + 8)
+            names_offset = index_offset + (cells * dim * 4 + count * 4 if cells else 0)
+            # Everything below is read through this descriptor, never the path:
+            # another worker may rename a newer file into place meanwhile
+            if os.fstat(f.fileno()).st_size != names_offset + names_len + groups_len:
+                return None
+
+            f.seek(names_offset)
+            names = json.loads(f.read(names_len).decode('utf-8'))
+            groups = {
+                int(gid): np.asarray(members, dtype=np.int64)
+                for gid, members in json.loads(f.read(groups_len).decode('utf-8')).items()
+            }
+
+            if count == 0:
+                return (
+                    np.empty((0, dim), dtype=np.float32),
+                    np.empty(0, dtype=np.float32),
+                    np.empty(0, dtype=np.int64),
+                    names,
+                    groups,
+                    None,
+                    version
+                )
+
+            # The mappings stay valid after the file is closed
+            offset = HEADER_SIZE
+            encodings = np.memmap(f, dtype=np.float32, mode='r', offset=offset, shape=(count, dim))
+            offset += count * dim * 4
+            sq_norms = np.memmap(f, dtype=np.float32, mode='r', offset=offset, shape=(count,))
+            offset += count * 4
+            student_ids = np.memmap(f, dtype=np.int64, mode='r', offset=offset, shape=(count,))
+
+            ivf = None
+            if cells:
+                # Centroids are tiny and read on every query; keep them in memory
+                f.seek(index_offset)
+                centroids = np.fromfile(f, dtype=np.float32, count=cells * dim).reshape(cells, dim)
+                labels = np.memmap(f, dtype=np.int32, mode='r', offset=index_offset + cells * dim * 4, shape=(count,))
+                ivf = (centroids, labels)
+    except (OSError, struct.error, ValueError):
+        return None
+
+    return encodings, sq_norms, student_ids, names, groups, ivf, version
+
+
+def snapshot_file_stamp(path):
+    """
+    Identifies the file currently at 'path' without reading it, or returns
+    None if there is none. Every write_snapshot_file produces a new file, so
+    a changed stamp means a new snapshot was published.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+@contextmanager
+def snapshot_file_lock(path):
+    """
+    Exclusive lock shared by every process using the snapshot file at 'path',
+    held while a process changes the gallery and publishes the new file.
+    """
+    if fcntl is None or not path:
+        yield
+        return
+
+    with open(f"{path}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,189 @@
+import time
+import threading
+from contextlib import contextmanager
+from flask import g, has_request_context, request, Response
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus style."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+class MetricsRegistry:
+    """
+    In-process histograms, counters and gauges, rendered in the Prometheus text format.
+
+    Collectors are callables returning (name, type, value, labels) tuples;
+    they are read at scrape time for values owned by other components.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._help = {}
+        self._collectors = []
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+            hist.observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        emitted = set()
+
+        def header(name, kind):
+            if name not in emitted:
+                emitted.add(name)
+                if name in self._help:
+                    lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+
+        for (name, labels), hist in histograms:
+            header(name, 'histogram')
+            for bound, count in zip(hist.buckets, hist.counts):
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} {count}')
+            lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {hist.count}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {hist.sum}')
+            lines.append(f'{name}_count{_format_labels(labels)} {hist.count}')
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+
+        for (name, labels), value in gauges:
+            header(name, 'gauge')
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+
+        for collector in self._collectors:
+            for name, kind, value, labels in collector():
+                header(name, kind)
+                lines.append(f'{name}{_format_labels(tuple(sorted(labels.items())))} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry
+metrics = MetricsRegistry()
+metrics.describe('face_stage_seconds', 'Time spent per processing stage.')
+metrics.describe('http_request_seconds', 'Request latency per endpoint.')
+metrics.describe('face_quality_rejected_total', 'Faces rejected by the quality gate before encoding, per reason.')
+
+
+def record_stage(path, stage, seconds):
+    """
+    Records one stage duration for a code path ('recognize', 'enroll',
+    'cache_reload', ...). Inside a request it is also kept for the slow log.
+    """
+    metrics.observe('face_stage_seconds', seconds, path=path, stage=stage)
+    if has_request_context():
+        stages = g.setdefault('stage_timings', {})
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(path, stage):
+    """Times the enclosed block as one stage of 'path'."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(path, stage, time.perf_counter() - start)
+
+
+def init_metrics(app):
+    """
+    Adds request timing, the opt-in slow-request log and the /metrics
+    endpoint to the app.
+    """
+    threshold = app.config['SLOW_REQUEST_THRESHOLD_MS'] / 1000.0
+
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.get('request_started')
+        if started is None or request.endpoint == 'metrics' or g.get('skip_request_metrics'):
+            return response
+
+        elapsed = time.perf_counter() - started
+        metrics.observe('http_request_seconds', elapsed, endpoint=request.endpoint or 'unknown')
+
+        if threshold > 0 and elapsed >= threshold:
+            stages = g.get('stage_timings', {})
+            breakdown = ', '.join(f'{k}={v * 1000:.1f}ms' for k, v in stages.items()) or 'no stages'
+            app.logger.warning(
+                f'Slow request {request.method} {request.path}: {elapsed * 1000:.1f}ms ({breakdown})'
+            )
+        return response
+
+    def _component_metrics():
+        engine = app.extensions.get('recognition_engine')
+        if engine is not None:
+            stats = engine.stats()
+            for key in ('workers', 'capacity', 'in_flight', 'queue_depth', 'busy_workers', 'utilization'):
+                yield f'recognition_engine_{key}', 'gauge', stats[key], {}
+            for key in ('submitted', 'completed', 'rejected', 'expired', 'failed'):
+                yield f'recognition_engine_{key}_total', 'counter', stats[key], {}
+
+        registry = app.extensions.get('tracker_registry')
+        if registry is not None:
+            stats = registry.stats()
+            yield 'face_tracking_cameras', 'gauge', stats['cameras'], {}
+            for key in ('faces_seen', 'faces_encoded', 'frames_skipped', 'frames_partial', 'frames_full'):
+                yield f'face_tracking_{key}_total', 'counter', stats[key], {}
+
+    metrics.add_collector(_component_metrics)
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        """Prometheus scrape endpoint."""
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,77 @@
+import cv2
+import numpy as np
+
+# Reasons a detected face is rejected before encoding
+TOO_SMALL = 'too_small'
+BLURRY = 'blurry'
+TOO_DARK = 'too_dark'
+TOO_BRIGHT = 'too_bright'
+
+# Crops are resized to this side before the blur score, so the score does
+# not depend on how large the face is in the frame
+SHARPNESS_CROP_SIZE = 64
+
+
+class LowQualityFace(ValueError):
+    """Raised when an enrollment photo's face fails the quality gate."""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def quality_settings(config):
+    """
+    Builds the quality gate thresholds from the app config.
+
+    Returns:
+        A dict of keyword arguments for assess_face, or None when the gate
+        is disabled.
+    """
+    if not config['FACE_QUALITY_GATING']:
+        return None
+    return {
+        'min_size': config['FACE_MIN_SIZE'],
+        'min_sharpness': config['FACE_MIN_SHARPNESS'],
+        'min_brightness': config['FACE_MIN_BRIGHTNESS'],
+        'max_brightness': config['FACE_MAX_BRIGHTNESS']
+    }
+
+def sharpness(gray):
+    """Variance of the Laplacian of a grayscale crop; low values mean blur."""
+    small = cv2.resize(gray, (SHARPNESS_CROP_SIZE, SHARPNESS_CROP_SIZE), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(small, cv2.CV_64F).var())
+
+def assess_face(image, box, min_size=0, min_sharpness=0.0, min_brightness=0, max_brightness=255):
+    """
+    Checks whether a detected face is worth encoding. Costs a crop, a
+    grayscale conversion and a 64x64 Laplacian, far less than an encoding.
+
+    Args:
+        image: RGB image as a numpy array.
+        box: The face's (top, right, bottom, left) box in image coordinates.
+        min_size: Minimum box side in pixels.
+        min_sharpness: Minimum Laplacian variance of the face crop.
+        min_brightness, max_brightness: Accepted range of the crop's mean gray level (0-255).
+
+    Returns:
+        None if the face passes, otherwise the rejection reason.
+    """
+    height, width = image.shape[:2]
+    top, right, bottom, left = box
+    top, bottom = max(0, int(top)), min(height, int(bottom))
+    left, right = max(0, int(left)), min(width, int(right))
+
+    if min(bottom - top, right - left) < max(min_size, 1):
+        return TOO_SMALL
+
+    gray = cv2.cvtColor(np.ascontiguousarray(image[top:bottom, left:right]), cv2.COLOR_RGB2GRAY)
+    brightness = float(gray.mean())
+    if brightness < min_brightness:
+        return TOO_DARK
+    if brightness > max_brightness:
+        return TOO_BRIGHT
+
+    if min_sharpness > 0 and sharpness(gray) < min_sharpness:
+        return BLURRY
+    return None
@@ -1,7 +1,14 @@
+import time
 import cv2
 import numpy as np
-import face_recognition
 from config import config
+from models.gallery_index import brute_force_search, squared_norms
+from models.face_tracker import match_boxes
+from models.face_quality import LowQualityFace, assess_face
+
+# face_recognition loads the dlib models when imported, which takes seconds.
+# It is imported inside the functions that need it, so importing this
+# module (and the app) stays fast.
 
 # --- File Validation ---
 
@@ -25,19 +32,178 @@ def load_image_file(path: str):
     img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
     return img
 
-def encode_face_from_image(image):
+def limit_image_size(image, max_dimension: int):
+    """
+    Shrinks an image so its longest side is at most max_dimension pixels.
+
+    Returns a tuple (image, scale) where scale is the factor that was applied
+    (1.0 if the image was already small enough or max_dimension is 0).
+    """
+    height, width = image.shape[:2]
+    longest = max(height, width)
+    if max_dimension <= 0 or longest <= max_dimension:
+        return image, 1.0
+
+    scale = max_dimension / longest
+    resized = cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+    return resized, scale
+
+def detect_faces(image, scale=1.0, model='hog', upsample=1):
+    """
+    Finds face locations, running the detector on a downscaled copy of the image.
+
+    Args:
+        image: RGB image as a numpy array.
+        scale: Factor applied to the image before detection (clamped to (0, 1]).
+        model: face_recognition detection model, 'hog' or 'cnn'.
+        upsample: Number of times the detector upsamples the image.
+
+    Returns:
+        A list of (top, right, bottom, left) boxes in full-resolution coordinates.
+    """
+    import face_recognition
+
+    scale = min(max(scale, 0.0), 1.0) or 1.0
+    if scale == 1.0:
+        return face_recognition.face_locations(image, number_of_times_to_upsample=upsample, model=model)
+
+    height, width = image.shape[:2]
+    small = cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+    small_locations = face_recognition.face_locations(small, number_of_times_to_upsample=upsample, model=model)
+
+    locations = []
+    for top, right, bottom, left in small_locations:
+        locations.append((
+            max(0, round(top / scale)),
+            min(width, round(right / scale)),
+            min(height, round(bottom / scale)),
+            max(0, round(left / scale))
+        ))
+    return locations
+
+def analyze_frame(image_bytes, max_dimension=0, detection_scale=1.0, model='hog', upsample=1,
+                  skip_boxes=(), iou_threshold=0.5, regions=None, quality=None):
+    """
+    Decodes an uploaded frame, finds every face in it and encodes them.
+
+    Args:
+        image_bytes: The encoded (JPEG/PNG) frame as uploaded.
+        max_dimension: Frames with a longer side than this are shrunk first (0 disables).
+        detection_scale, model, upsample: Passed to detect_faces.
+        skip_boxes: Boxes (uploaded-frame coordinates) whose encodings the caller
+                    already has; a detection overlapping one is not encoded.
+        iou_threshold: Minimum overlap for a detection to match a skip box.
+        regions: Optional (top, right, bottom, left) boxes in uploaded-frame
+                 coordinates; when given, only these areas are searched.
+        quality: Optional assess_face thresholds. New faces failing them are
+                 not encoded and are reported under 'low_quality' instead.
+
+    Returns:
+        None if the bytes could not be decoded, otherwise a dict with
+        - locations: (top, right, bottom, left) boxes in uploaded-frame coordinates.
+        - reused: For each box, the index of the skip box it matched, or -1.
+        - encodings: An (E x 128) float32 array for the boxes with reused == -1, in order.
+        - low_quality: {'location', 'reason'} for each rejected face; these
+          boxes are not part of 'locations'.
+        - detection_scale: Scale of the detection pass relative to the uploaded frame.
+        - timings: Seconds spent in the decode, detect, quality and encode stages.
+    """
+    import face_recognition
+
+    t0 = time.perf_counter()
+    arr = np.frombuffer(image_bytes, np.uint8)
+    img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+
+    # Oversized uploads are shrunk before any other work is done
+    img, input_scale = limit_image_size(img, max_dimension)
+    rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    t1 = time.perf_counter()
+
+    if regions:
+        face_locations = []
+        height, width = rgb_img.shape[:2]
+        for top, right, bottom, left in regions:
+            top, bottom = max(0, int(top * input_scale)), min(height, int(bottom * input_scale))
+            left, right = max(0, int(left * input_scale)), min(width, int(right * input_scale))
+            if bottom - top < 20 or right - left < 20:
+                continue
+
+            crop = np.ascontiguousarray(rgb_img[top:bottom, left:right])
+            for t, r, b, l in detect_faces(crop, scale=detection_scale, model=model, upsample=upsample):
+                face_locations.append((t + top, r + left, b + top, l + left))
+    else:
+        face_locations = detect_faces(rgb_img, scale=detection_scale, model=model, upsample=upsample)
+
+    # Boxes are reported in the coordinates of the uploaded frame
+    if input_scale != 1.0:
+        frame_locations = [tuple(round(v / input_scale) for v in loc) for loc in face_locations]
+    else:
+        frame_locations = face_locations
+    frame_locations = [tuple(int(v) for v in loc) for loc in frame_locations]
+
+    t2 = time.perf_counter()
+
+    reused = match_boxes(frame_locations, list(skip_boxes), iou_threshold) if skip_boxes else [-1] * len(frame_locations)
+
+    # Faces that would need a new encoding must pass the quality gate first
+    low_quality = []
+    if quality:
+        kept = []
+        for i, idx in enumerate(reused):
+            reason = assess_face(rgb_img, face_locations[i], **quality) if idx < 0 else None
+            if reason is None:
+                kept.append(i)
+            else:
+                low_quality.append({'location': frame_locations[i], 'reason': reason})
+        if low_quality:
+            face_locations = [face_locations[i] for i in kept]
+            frame_locations = [frame_locations[i] for i in kept]
+            reused = [reused[i] for i in kept]
+    t3 = time.perf_counter()
+
+    to_encode = [loc for loc, idx in zip(face_locations, reused) if idx < 0]
+    live_encodings = face_recognition.face_encodings(rgb_img, to_encode, model=config.ENCODING_MODEL) if to_encode else []
+    t4 = time.perf_counter()
+
+    return {
+        'locations': frame_locations,
+        'reused': reused,
+        'encodings': np.asarray(live_encodings, dtype=np.float32).reshape(-1, 128),
+        'low_quality': low_quality,
+        'detection_scale': input_scale * (detection_scale if 0.0 < detection_scale < 1.0 else 1.0),
+        'timings': {'decode': t1 - t0, 'detect': t2 - t1, 'quality': t3 - t2, 'encode': t4 - t3}
+    }
+
+def encode_face_from_image(image, quality=None):
     """
     Given an image (as a numpy array), find the first face and
     return its 128-dimension face encoding.
     
     Returns None if no face is found.
+
+    With 'quality' thresholds (see assess_face), the first face passing
+    them is encoded; LowQualityFace is raised if there are faces but none
+    passes.
     """
+    import face_recognition
+
     # Find all face locations in the image
     face_locations = face_recognition.face_locations(image)
+
+    if quality and face_locations:
+        reasons = [assess_face(image, loc, **quality) for loc in face_locations]
+        passing = [loc for loc, reason in zip(face_locations, reasons) if reason is None]
+        if not passing:
+            raise LowQualityFace(reasons[0])
+        face_locations = passing[:1]
     
-    # Get face encodings
+    # Get face encodings, with the gallery's encoding settings
     # This returns a list, even if there's only one face
-    face_encodings = face_recognition.face_encodings(image, face_locations)
+    face_encodings = face_recognition.face_encodings(
+        image, face_locations, num_jitters=config.ENCODING_NUM_JITTERS, model=config.ENCODING_MODEL
+    )
 
     if len(face_encodings) == 0:
         # No faces found in the image
@@ -46,14 +212,26 @@ def encode_face_from_image(image):
     # Return the encoding for the first face found
     return face_encodings[0]
 
+def encode_face_from_bytes(image_bytes, quality=None):
+    """
+    Decodes an uploaded image straight from its bytes and returns the
+    encoding of its first face (see encode_face_from_image).
+
+    Raises ValueError if the bytes are not a readable image.
+    """
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image")
+    return encode_face_from_image(cv2.cvtColor(img, cv2.COLOR_BGR2RGB), quality)
+
 # --- Face Comparison ---
 
-def compare_face(known_encodings: list, face_encoding, tolerance=0.5):
+def compare_face(known_encodings, face_encoding, tolerance=0.5):
     """
     Compare a list of known face encodings against one new encoding.
     
     Args:
-        known_encodings: A list of 128d encodings from the database.
+        known_encodings: A list or (N x 128) array of encodings from the database.
         face_encoding: A single 128d encoding from the webcam.
         tolerance: How strict the match is. Lower is stricter. 0.5 is a good value.
                    
@@ -65,6 +243,8 @@ def compare_face(known_encodings: list, face_encoding, tolerance=0.5):
     if len(known_encodings) == 0:
         return (None, 1.0) # Return 1.0 for distance (0.0 confidence) if no known faces
 
+    import face_recognition
+
     # Calculate the "distance" between the new face and all known faces
     # The lower the distance, the more similar the faces are.
     distances = face_recognition.face_distance(known_encodings, face_encoding)
@@ -82,4 +262,41 @@ def compare_face(known_encodings: list, face_encoding, tolerance=0.5):
         return (best_match_index, confidence)
     else:
         # No match found
-        return (None, confidence)
\ No newline at end of file
+        return (None, confidence)
+
+def compare_faces_batch(known_encodings, live_encodings, tolerance=0.5, known_sq_norms=None, index=None):
+    """
+    Match every live encoding of a frame against the known encodings at once.
+
+    Uses ||a - b||^2 = ||a||^2 + ||b||^2 - 2ab so the whole frame costs a single
+    (M x 128) @ (128 x N) product instead of one scan per face.
+
+    Args:
+        known_encodings: A contiguous (N x 128) float32 matrix of known encodings.
+        live_encodings: A sequence of M 128d encodings from the webcam.
+        tolerance: Maximum distance accepted as a match.
+        known_sq_norms: Optional precomputed squared norms of known_encodings.
+        index: Optional IVFIndex built for known_encodings. When given, only the
+               probed cells are scanned (approximate search).
+
+    Returns:
+        A tuple (match_indices, distances) of length-M arrays
+        - match_indices: Index of the best match for each live face, -1 if no match.
+        - distances: Distance to the best match (1.0 if there are no known faces).
+    """
+    live = np.asarray(live_encodings, dtype=np.float32).reshape(-1, known_encodings.shape[1])
+    n_live = live.shape[0]
+
+    if n_live == 0 or known_encodings.shape[0] == 0:
+        return np.full(n_live, -1, dtype=np.int64), np.ones(n_live, dtype=np.float32)
+
+    if known_sq_norms is None:
+        known_sq_norms = squared_norms(known_encodings)
+
+    if index is not None:
+        best, best_distances = index.search(known_encodings, known_sq_norms, live)
+    else:
+        best, best_distances = brute_force_search(known_encodings, known_sq_norms, live)
+
+    match_indices = np.where(best_distances <= tolerance, best, -1)
+    return match_indices, best_distances
@@ -0,0 +1,247 @@
+import time
+import itertools
+import threading
+from models.motion_gate import MotionGate, STATIC, PARTIAL, FULL
+
+# --- Box Association ---
+
+def box_iou(a, b) -> float:
+    """Intersection over union of two (top, right, bottom, left) boxes."""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    if bottom <= top or right <= left:
+        return 0.0
+
+    inter = (bottom - top) * (right - left)
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    return inter / float(area_a + area_b - inter)
+
+def boxes_overlap(a, b) -> bool:
+    """True if two (top, right, bottom, left) boxes intersect."""
+    return a[0] < b[2] and b[0] < a[2] and a[3] < b[1] and b[3] < a[1]
+
+def match_boxes(boxes, targets, threshold=0.5):
+    """
+    Greedy one-to-one association of boxes to target boxes by IoU.
+
+    Returns:
+        A list with, for every box, the index of its target or -1 if no
+        target overlaps it by at least 'threshold'.
+    """
+    pairs = []
+    for i, box in enumerate(boxes):
+        for j, target in enumerate(targets):
+            iou = box_iou(box, target)
+            if iou >= threshold:
+                pairs.append((iou, i, j))
+
+    matched = [-1] * len(boxes)
+    used_targets = set()
+    for _, i, j in sorted(pairs, reverse=True):
+        if matched[i] == -1 and j not in used_targets:
+            matched[i] = j
+            used_targets.add(j)
+    return matched
+
+# --- Tracks ---
+
+_track_ids = itertools.count(1)
+
+class Track:
+    """
+    One face followed across the frames of a camera.
+
+    The identity fields are filled by matching 'encoding' against the gallery;
+    gallery_version records which gallery they came from so a changed gallery
+    triggers a re-match (of the stored encoding, not a re-encode).
+    """
+
+    def __init__(self, box, encoding):
+        self.id = next(_track_ids)
+        self.box = box
+        self.encoding = encoding
+        self.frames_since_encode = 0
+        self.missed = 0
+
+        self.student_pk = None
+        self.name = None
+        self.distance = 1.0
+        self.gallery_version = None
+
+    def set_encoding(self, encoding):
+        self.encoding = encoding
+        self.frames_since_encode = 0
+        # New encoding, so the identity has to be matched again
+        self.gallery_version = None
+
+class FaceTracker:
+    """
+    Keeps the face tracks of one camera so faces that stay in place are not
+    re-encoded on every frame.
+
+    Confirmed tracks, i.e. those matched to a student, are offered to the
+    detector as reusable boxes; a detection overlapping one reuses its
+    encoding and identity. Tracks are re-encoded every 'reencode_interval'
+    frames for verification and dropped after 'max_missed' frames without a
+    detection.
+
+    A camera's tracker may also own a MotionGate and the results of its last
+    analysed frame, which are returned again for frames without motion.
+    """
+
+    def __init__(self, iou_threshold=0.5, reencode_interval=10, max_missed=3, motion_gate=None):
+        self.iou_threshold = iou_threshold
+        self.reencode_interval = reencode_interval
+        self.max_missed = max_missed
+        self.motion_gate = motion_gate
+
+        self.tracks = []
+        self.last_results = None
+        self.last_detection_scale = None
+        # Gallery version the replayed results were matched against
+        self.last_gallery_version = None
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+    def reusable_tracks(self):
+        """
+        Tracks whose encoding can be reused for an overlapping detection this
+        frame. Only tracks matched to a student qualify: an unmatched face
+        (e.g. turned away or blurred) is encoded again on the next frame.
+        """
+        return [t for t in self.tracks
+                if t.student_pk is not None and t.frames_since_encode < self.reencode_interval]
+
+    def update(self, locations, reused, encodings, reusable, regions=None):
+        """
+        Folds one frame's detections into the tracks.
+
+        Args:
+            locations: Detected boxes of the frame.
+            reused: For each box, the index into 'reusable' whose encoding it
+                    reuses, or -1 if the box was encoded.
+            encodings: Encodings of the boxes with reused == -1, in order.
+            reusable: The list returned by reusable_tracks() for this frame.
+            regions: The areas searched if only part of the frame was; tracks
+                     entirely outside them are carried over unchanged.
+
+        Returns:
+            The track of every detected box, in the order of 'locations',
+            followed by any carried-over tracks.
+        """
+        self.last_used = time.monotonic()
+        frame_tracks = [None] * len(locations)
+
+        for i, idx in enumerate(reused):
+            if idx >= 0:
+                track = reusable[idx]
+                track.box = locations[i]
+                track.frames_since_encode += 1
+                frame_tracks[i] = track
+
+        # Encoded boxes continue a remaining track if they overlap one
+        encoded = [i for i, idx in enumerate(reused) if idx < 0]
+        claimed = {t.id for t in frame_tracks if t is not None}
+        candidates = [t for t in self.tracks if t.id not in claimed]
+        matches = match_boxes([locations[i] for i in encoded], [t.box for t in candidates], self.iou_threshold)
+
+        for i, encoding, match in zip(encoded, encodings, matches):
+            if match >= 0:
+                track = candidates[match]
+                track.box = locations[i]
+                track.set_encoding(encoding)
+            else:
+                track = Track(locations[i], encoding)
+                self.tracks.append(track)
+            frame_tracks[i] = track
+
+        if regions:
+            claimed = {t.id for t in frame_tracks}
+            frame_tracks += [
+                t for t in self.tracks
+                if t.id not in claimed and not any(boxes_overlap(t.box, r) for r in regions)
+            ]
+
+        seen = {t.id for t in frame_tracks}
+        for track in self.tracks:
+            track.missed = 0 if track.id in seen else track.missed + 1
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+
+        return frame_tracks
+
+class TrackerRegistry:
+    """Per-camera FaceTrackers, dropped after 'ttl' seconds without frames."""
+
+    def __init__(self, ttl=300.0, motion_settings=None, **tracker_settings):
+        self.ttl = ttl
+        self.motion_settings = motion_settings
+        self.tracker_settings = tracker_settings
+        self._trackers = {}
+        self._lock = threading.Lock()
+
+        self.faces_seen = 0
+        self.faces_encoded = 0
+        self.frames = {STATIC: 0, PARTIAL: 0, FULL: 0}
+
+    def new_tracker(self, with_motion_gate=False) -> FaceTracker:
+        gate = None
+        if with_motion_gate and self.motion_settings is not None:
+            gate = MotionGate(**self.motion_settings)
+        return FaceTracker(motion_gate=gate, **self.tracker_settings)
+
+    def get(self, camera_id: str) -> FaceTracker:
+        now = time.monotonic()
+        with self._lock:
+            expired = [cid for cid, t in self._trackers.items() if now - t.last_used > self.ttl]
+            for cid in expired:
+                del self._trackers[cid]
+
+            tracker = self._trackers.get(camera_id)
+            if tracker is None:
+                tracker = self._trackers[camera_id] = self.new_tracker(with_motion_gate=True)
+            tracker.last_used = now
+            return tracker
+
+    def record(self, seen: int, encoded: int, decision=FULL):
+        with self._lock:
+            self.faces_seen += seen
+            self.faces_encoded += encoded
+            self.frames[decision] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'cameras': len(self._trackers),
+                'faces_seen': self.faces_seen,
+                'faces_encoded': self.faces_encoded,
+                'frames_skipped': self.frames[STATIC],
+                'frames_partial': self.frames[PARTIAL],
+                'frames_full': self.frames[FULL]
+            }
+
+def init_tracker_registry(app):
+    """Creates the app's TrackerRegistry from its config."""
+    config = app.config
+    motion_settings = None
+    if config['MOTION_GATING']:
+        motion_settings = {
+            'pixel_threshold': config['MOTION_PIXEL_THRESHOLD'],
+            'min_changed_fraction': config['MOTION_MIN_CHANGED_FRACTION'],
+            'max_region_fraction': config['MOTION_MAX_REGION_FRACTION'],
+            'padding': config['MOTION_REGION_PADDING'],
+            'full_interval': config['MOTION_FULL_INTERVAL']
+        }
+
+    registry = TrackerRegistry(
+        ttl=config['CAMERA_SESSION_TTL'],
+        motion_settings=motion_settings,
+        iou_threshold=config['TRACKING_IOU_THRESHOLD'],
+        reencode_interval=config['TRACKING_REENCODE_INTERVAL'],
+        max_missed=config['TRACKING_MAX_MISSED']
+    )
+    app.extensions['tracker_registry'] = registry
+    return registry
+
+def get_tracker_registry(app) -> TrackerRegistry:
+    return app.extensions['tracker_registry']
@@ -0,0 +1,189 @@
+import numpy as np
+
+# --- Exact Search ---
+
+def squared_norms(matrix):
+    """Row-wise squared L2 norms of a 2D array."""
+    return np.einsum('ij,ij->i', matrix, matrix)
+
+def brute_force_search(known_encodings, known_sq_norms, live):
+    """
+    Finds the nearest known encoding for every live encoding by scanning
+    the whole gallery.
+
+    Args:
+        known_encodings: An (N x D) float32 matrix, N > 0.
+        known_sq_norms: Squared norms of known_encodings.
+        live: An (M x D) float32 matrix of query encodings.
+
+    Returns:
+        A tuple (best_indices, best_distances) of length-M arrays.
+    """
+    sq_dists = live @ known_encodings.T
+    sq_dists *= -2.0
+    sq_dists += known_sq_norms[np.newaxis, :]
+    sq_dists += squared_norms(live)[:, np.newaxis]
+
+    best = np.argmin(sq_dists, axis=1)
+    # Rounding can push the squared distance of near-identical faces below zero
+    best_distances = np.sqrt(np.maximum(sq_dists[np.arange(live.shape[0]), best], 0.0))
+    return best, best_distances
+
+def _nearest_centroids(vectors, centroids, chunk_size=16384):
+    """Index of the closest centroid for each row, computed in chunks to bound memory."""
+    centroid_sq_norms = squared_norms(centroids)
+    labels = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], chunk_size):
+        chunk = vectors[start:start + chunk_size]
+        # ||x||^2 is constant per row so it doesn't change the argmin
+        scores = centroid_sq_norms[np.newaxis, :] - 2.0 * (chunk @ centroids.T)
+        labels[start:start + chunk_size] = np.argmin(scores, axis=1)
+    return labels
+
+# --- Approximate Search ---
+
+class IVFIndex:
+    """
+    Inverted-file index over a gallery matrix.
+
+    A k-means coarse quantizer splits the gallery into 'nlist' cells; a query
+    only scans the rows of its 'nprobe' closest cells. The index holds no
+    encodings of its own, only the cell of every row, so workers sharing a
+    memory-mapped gallery don't each keep a copy. When a cell's rows are
+    consecutive in the gallery (see cell_order()), it is scanned in place as
+    one contiguous block; otherwise its rows are gathered per query.
+    """
+
+    def __init__(self, centroids, labels, nprobe=8):
+        self.centroids = centroids
+        self.labels = labels
+        self.nprobe = nprobe
+
+        # Rows of cell c are order[offsets[c]:offsets[c + 1]] in the gallery
+        self.order = np.argsort(labels, kind='stable')
+        counts = np.bincount(labels, minlength=centroids.shape[0])
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        # A cell is contiguous if its rows are a run of consecutive gallery
+        # rows, i.e. no break (a step other than +1 in 'order') lies inside it
+        breaks = np.concatenate([[0], np.cumsum(np.diff(self.order) != 1)])
+        top = max(self.order.size - 1, 0)
+        first = np.minimum(self.offsets[:-1], top)
+        last = np.clip(self.offsets[1:] - 1, 0, top)
+        self.contiguous = (counts == 0) | (breaks[last] == breaks[first])
+        self._centroid_sq_norms = squared_norms(centroids)
+
+    @property
+    def nlist(self):
+        return self.centroids.shape[0]
+
+    @classmethod
+    def build(cls, encodings, nlist=0, nprobe=8, iterations=10, max_training_rows=65536, seed=0):
+        """
+        Trains the coarse quantizer on (a sample of) the gallery and assigns
+        every row to a cell.
+
+        Args:
+            encodings: An (N x D) float32 gallery matrix.
+            nlist: Number of cells; 0 picks roughly sqrt(N).
+            nprobe: Number of cells scanned per query.
+            iterations: k-means iterations.
+            max_training_rows: Upper bound on the k-means training sample.
+            seed: Seed for sampling, so rebuilds are reproducible.
+        """
+        n = encodings.shape[0]
+        if nlist <= 0:
+            nlist = max(1, int(np.sqrt(n)))
+        nlist = min(nlist, n)
+
+        rng = np.random.default_rng(seed)
+        if n > max_training_rows:
+            training = encodings[rng.choice(n, max_training_rows, replace=False)]
+        else:
+            training = encodings
+
+        centroids = training[rng.choice(training.shape[0], nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = _nearest_centroids(training, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, training)
+            counts = np.bincount(labels, minlength=nlist)
+            filled = counts > 0
+            # Empty cells keep their previous centroid
+            centroids[filled] = sums[filled] / counts[filled, np.newaxis]
+
+        return cls(centroids, _nearest_centroids(encodings, centroids), nprobe)
+
+    def with_added(self, encodings, n_added):
+        """
+        Returns an index for 'encodings', the gallery after n_added rows were
+        appended. New rows go to their nearest existing cell; nothing is retrained.
+        """
+        new_labels = _nearest_centroids(encodings[-n_added:], self.centroids)
+        return IVFIndex(self.centroids, np.concatenate([self.labels, new_labels]), self.nprobe)
+
+    def with_kept(self, keep):
+        """Returns an index for the gallery filtered by the boolean mask 'keep'."""
+        return IVFIndex(self.centroids, self.labels[keep], self.nprobe)
+
+    def reassigned(self, encodings):
+        """
+        Returns an index for an arbitrary new gallery matrix that reuses the
+        trained centroids: every row is assigned to its nearest cell again.
+        Much cheaper than build() when the gallery changed only slightly.
+        """
+        return IVFIndex(self.centroids, _nearest_centroids(encodings, self.centroids), self.nprobe)
+
+    def cell_order(self):
+        """
+        Returns (permutation, index): gallery rows reordered by cell, and the
+        index for the reordered gallery, in which every cell is contiguous.
+        """
+        return self.order, IVFIndex(self.centroids, self.labels[self.order], self.nprobe)
+
+    def search(self, known_encodings, known_sq_norms, live):
+        """
+        Approximate version of brute_force_search with the same arguments
+        and return values. known_encodings must be the matrix the index was
+        built for; only the probed cells are read.
+        """
+        n_live = live.shape[0]
+        best = np.zeros(n_live, dtype=np.int64)
+        # Partial squared distances: ||x||^2 is added back at the end
+        best_partial = np.full(n_live, np.inf, dtype=np.float32)
+
+        nprobe = min(self.nprobe, self.nlist)
+        cell_scores = self._centroid_sq_norms[np.newaxis, :] - 2.0 * (live @ self.centroids.T)
+        probed = np.argpartition(cell_scores, nprobe - 1, axis=1)[:, :nprobe]
+
+        # Scan cell by cell so every query probing a cell shares one product
+        for cell in np.unique(probed):
+            lo, hi = self.offsets[cell], self.offsets[cell + 1]
+            if lo == hi:
+                continue
+
+            if self.contiguous[cell]:
+                rows = slice(self.order[lo], self.order[lo] + hi - lo)
+            else:
+                rows = self.order[lo:hi]
+
+            queries = np.nonzero((probed == cell).any(axis=1))[0]
+            partial = known_sq_norms[np.newaxis, rows] - 2.0 * (live[queries] @ known_encodings[rows].T)
+            nearest = np.argmin(partial, axis=1)
+            values = partial[np.arange(queries.size), nearest]
+
+            better = values < best_partial[queries]
+            best_partial[queries[better]] = values[better]
+            best[queries[better]] = self.order[lo + nearest[better]]
+
+        best_sq = best_partial + squared_norms(live)
+        best_distances = np.sqrt(np.maximum(best_sq, 0.0))
+
+        missed = np.isinf(best_partial)
+        if missed.any():
+            # All probed cells were empty; fall back to a full scan
+            best[missed], best_distances[missed] = brute_force_search(
+                known_encodings, known_sq_norms, live[missed]
+            )
+
+        return best, best_distances
@@ -0,0 +1,109 @@
+import cv2
+import numpy as np
+
+# Frames are compared on a grayscale thumbnail decoded at 1/8 scale, which
+# JPEG decoders produce far cheaper than the full image
+THUMBNAIL_FACTOR = 8
+
+# Outcomes of MotionGate.check
+STATIC = 'static'
+PARTIAL = 'partial'
+FULL = 'full'
+
+
+def frame_thumbnail(image_bytes):
+    """Decodes a small grayscale thumbnail of an encoded frame, or None if undecodable."""
+    arr = np.frombuffer(image_bytes, np.uint8)
+    thumb = cv2.imdecode(arr, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if thumb is None:
+        return None
+    return cv2.GaussianBlur(thumb, (5, 5), 0)
+
+
+def _merge_boxes(boxes):
+    """Merges overlapping (top, right, bottom, left) boxes until none overlap."""
+    boxes = list(boxes)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                if a[0] < b[2] and b[0] < a[2] and a[3] < b[1] and b[3] < a[1]:
+                    boxes[i] = (min(a[0], b[0]), max(a[1], b[1]), max(a[2], b[2]), min(a[3], b[3]))
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return boxes
+
+
+class MotionGate:
+    """
+    Decides per frame of one camera how much detection work is needed by
+    diffing its thumbnail against the last frame that was analysed.
+
+    - STATIC: almost nothing changed; the previous results can be reused.
+    - PARTIAL: motion is confined to a few regions; only those are searched.
+    - FULL: large or first-time change; the whole frame is searched.
+
+    A FULL pass is forced every 'full_interval' frames, static ones
+    included, so a scene that stays still is still re-analysed.
+    """
+
+    def __init__(self, pixel_threshold=25, min_changed_fraction=0.002,
+                 max_region_fraction=0.5, padding=0.5, full_interval=30):
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_fraction = min_changed_fraction
+        self.max_region_fraction = max_region_fraction
+        self.padding = padding
+        self.full_interval = full_interval
+
+        self.reference = None
+        self.frames_since_full = 0
+
+    def check(self, thumb):
+        """
+        Returns a tuple (decision, regions) where regions are padded
+        (top, right, bottom, left) boxes in full-frame coordinates for PARTIAL.
+        """
+        if self.reference is None or self.reference.shape != thumb.shape \
+                or self.frames_since_full >= self.full_interval:
+            return FULL, []
+
+        diff = cv2.absdiff(thumb, self.reference)
+        _, mask = cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)
+        changed = cv2.countNonZero(mask)
+        height, width = thumb.shape
+        if changed < self.min_changed_fraction * height * width:
+            # Skipped frames count toward the forced FULL pass; commit() is
+            # only called for analysed frames
+            self.frames_since_full += 1
+            return STATIC, []
+
+        mask = cv2.dilate(mask, np.ones((3, 3), np.uint8), iterations=2)
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+
+        boxes = []
+        for x, y, w, h, _ in stats[1:count]:
+            pad_x, pad_y = int(w * self.padding) + 2, int(h * self.padding) + 2
+            boxes.append((
+                max(0, y - pad_y),
+                min(width, x + w + pad_x),
+                min(height, y + h + pad_y),
+                max(0, x - pad_x)
+            ))
+        boxes = _merge_boxes(boxes)
+
+        area = sum((b[2] - b[0]) * (b[1] - b[3]) for b in boxes)
+        if not boxes or area > self.max_region_fraction * height * width:
+            return FULL, []
+
+        regions = [tuple(int(v) * THUMBNAIL_FACTOR for v in box) for box in boxes]
+        return PARTIAL, regions
+
+    def commit(self, thumb, decision):
+        """Makes 'thumb' the reference after the frame has been analysed."""
+        self.reference = thumb
+        self.frames_since_full = 0 if decision == FULL else self.frames_since_full + 1
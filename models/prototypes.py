@@ -0,0 +1,134 @@
+import numpy as np
+from models.gallery_index import squared_norms
+
+# --- Student Grouping ---
+
+def group_by_student(student_ids):
+    """
+    Orders gallery rows so each student's rows are contiguous.
+
+    Returns:
+        A tuple (order, offsets): rows of the i-th student are
+        order[offsets[i]:offsets[i + 1]].
+    """
+    order = np.argsort(student_ids, kind='stable')
+    boundaries = np.nonzero(np.diff(student_ids[order]))[0] + 1
+    offsets = np.concatenate([[0], boundaries, [order.size]])
+    return order, offsets
+
+def segment_offsets(student_ids):
+    """Start offsets of the runs of equal ids in an already grouped id array, plus the end."""
+    if student_ids.size == 0:
+        return np.zeros(1, dtype=np.int64)
+    boundaries = np.nonzero(np.diff(student_ids))[0] + 1
+    return np.concatenate([[0], boundaries, [student_ids.size]])
+
+# --- Medoid Prototypes ---
+
+def select_medoids(encodings, k, iterations=5):
+    """
+    Picks up to k rows of one student's encodings that best represent them.
+
+    Seeds with the overall medoid plus farthest-first picks, so distinct
+    looks (glasses, lighting) each get a prototype, then refines with a few
+    k-medoids (Voronoi) iterations. Prototypes are real photos, so match
+    distances keep their usual meaning for the tolerance.
+
+    Returns:
+        Sorted row indices into 'encodings'.
+    """
+    n = encodings.shape[0]
+    if n <= k:
+        return np.arange(n)
+
+    sq = squared_norms(encodings)
+    d = np.sqrt(np.maximum(sq[:, None] + sq[None, :] - 2.0 * (encodings @ encodings.T), 0.0))
+
+    chosen = [int(np.argmin(d.sum(axis=1)))]
+    while len(chosen) < k:
+        chosen.append(int(np.argmax(d[:, chosen].min(axis=1))))
+
+    for _ in range(iterations):
+        assignment = np.argmin(d[:, chosen], axis=1)
+        refined = []
+        for c, current in enumerate(chosen):
+            members = np.nonzero(assignment == c)[0]
+            if members.size == 0:
+                refined.append(current)
+                continue
+            refined.append(int(members[np.argmin(d[np.ix_(members, members)].sum(axis=1))]))
+        if refined == chosen:
+            break
+        chosen = refined
+
+    return np.unique(chosen)
+
+def reduce_to_prototypes(encodings, student_ids, names, k):
+    """
+    Compresses a per-photo gallery to at most k medoid prototypes per
+    student, grouped contiguously by student.
+
+    Args:
+        encodings: An (N x 128) float32 matrix.
+        student_ids: Length-N array of the owning student's primary key.
+        names: Length-N list of the owning student's name.
+        k: Prototypes per student; 0 keeps every row (only grouping them).
+
+    Returns:
+        A tuple (encodings, student_ids, names) of the kept rows.
+    """
+    student_ids = np.asarray(student_ids, dtype=np.int64)
+    if student_ids.size == 0:
+        return encodings, student_ids, list(names)
+
+    order, offsets = group_by_student(student_ids)
+    if k > 0:
+        keep = []
+        for lo, hi in zip(offsets[:-1], offsets[1:]):
+            rows = order[lo:hi]
+            keep.append(rows[select_medoids(encodings[rows], k)])
+        order = np.concatenate(keep)
+
+    return (
+        np.ascontiguousarray(encodings[order]),
+        student_ids[order],
+        [names[i] for i in order]
+    )
+
+# --- Student-Level Matching ---
+
+def match_students(known_encodings, known_sq_norms, student_ids, live, tolerance=0.5):
+    """
+    Matches live encodings against a gallery grouped by student and returns
+    student ids directly.
+
+    The distances to every row are reduced with a segmented minimum over
+    each student's contiguous rows, giving one distance per student.
+
+    Args:
+        known_encodings: An (N x 128) float32 matrix grouped by student.
+        known_sq_norms: Squared norms of known_encodings.
+        student_ids: Length-N student primary keys, grouped.
+        live: An (M x 128) float32 matrix of query encodings.
+        tolerance: Maximum distance accepted as a match.
+
+    Returns:
+        A tuple (matched_ids, distances) of length-M arrays; matched_ids
+        is -1 where the closest student is farther than the tolerance.
+    """
+    n_live = live.shape[0]
+    if n_live == 0 or known_encodings.shape[0] == 0:
+        return np.full(n_live, -1, dtype=np.int64), np.ones(n_live, dtype=np.float32)
+
+    sq_dists = live @ known_encodings.T
+    sq_dists *= -2.0
+    sq_dists += known_sq_norms[np.newaxis, :]
+
+    offsets = segment_offsets(student_ids)
+    per_student = np.minimum.reduceat(sq_dists, offsets[:-1], axis=1)
+    best = np.argmin(per_student, axis=1)
+
+    best_sq = per_student[np.arange(n_live), best] + squared_norms(live)
+    distances = np.sqrt(np.maximum(best_sq, 0.0))
+    matched = student_ids[offsets[best]]
+    return np.where(distances <= tolerance, matched, -1), distances
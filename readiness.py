@@ -0,0 +1,93 @@
+import os
+import time
+import threading
+from cache import load_known_faces
+from recognition_engine import get_recognition_engine
+
+
+class Readiness:
+    """
+    Startup work that runs in the background so the app can accept
+    connections immediately: loading the face gallery and starting the
+    recognition workers, which load the models.
+
+    /readyz reports ready once the gallery and the models are loaded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.gallery_loaded = False
+        self.models_loaded = False
+        self.errors = {}
+        self.timings = {}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    @property
+    def ready(self) -> bool:
+        return self.gallery_loaded and self.models_loaded
+
+    def start(self):
+        """
+        Starts the background work for this process. Called again from a
+        forked server worker (e.g. gunicorn --preload), it starts over there,
+        since threads and process pools don't survive a fork.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.gallery_loaded = False
+            self.models_loaded = False
+            self.errors = {}
+
+        threading.Thread(target=self._run, name='startup', daemon=True).start()
+
+    def _run(self):
+        started = time.perf_counter()
+        with self.app.app_context():
+            try:
+                load_known_faces()
+                self.gallery_loaded = True
+                self.timings['gallery'] = time.perf_counter() - started
+            except Exception as e:
+                self.app.logger.error(f'Loading the face gallery failed: {e}')
+                self.errors['gallery'] = str(e)
+
+        started = time.perf_counter()
+        try:
+            get_recognition_engine(self.app).warm_up()
+            self.models_loaded = True
+            self.timings['models'] = time.perf_counter() - started
+        except Exception as e:
+            self.app.logger.error(f'Loading the recognition models failed: {e}')
+            self.errors['models'] = str(e)
+
+    def to_dict(self):
+        """Returns a dictionary representation of the startup state."""
+        return {
+            'ready': self.ready,
+            'gallery_loaded': self.gallery_loaded,
+            'models_loaded': self.models_loaded,
+            'timings': {k: round(v, 3) for k, v in self.timings.items()},
+            'errors': self.errors
+        }
+
+
+def init_readiness(app):
+    """Creates the app's Readiness tracker and starts the background startup work."""
+    readiness = Readiness(app)
+    app.extensions['readiness'] = readiness
+    readiness.start()
+
+    @app.before_request
+    def _restart_after_fork():
+        readiness.start()
+
+    return readiness
+
+
+def get_readiness(app) -> Readiness:
+    return app.extensions['readiness']
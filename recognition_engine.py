@@ -0,0 +1,241 @@
+import os
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from models.face_quality import quality_settings
+
+# Marker a worker returns instead of a result when the frame's deadline had
+# already passed before it was picked up
+EXPIRED = 'expired'
+
+
+class EngineBusy(Exception):
+    """Raised when a frame is rejected because the engine's queue is full."""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a frame could not be processed before its deadline."""
+
+
+# --- Worker Process Side ---
+
+def warm_up_models(dummy_inference=True):
+    """
+    Process pool initializer: loads the dlib models and, if 'dummy_inference'
+    is set, runs one dummy detection and encoding so the first real frame
+    doesn't pay the cold-start cost.
+    """
+    # Importing face_recognition loads the dlib models
+    import face_recognition
+    if not dummy_inference:
+        return
+    blank = np.zeros((64, 64, 3), dtype=np.uint8)
+    face_recognition.face_locations(blank)
+    face_recognition.face_encodings(blank, [(8, 56, 56, 8)])
+
+
+def _worker_ready():
+    """Runs in a worker process once the initializer has loaded the models."""
+    return os.getpid()
+
+
+def _process_frame(image_bytes, settings, skip_boxes, regions, deadline):
+    """Runs in a worker process. Returns (result, busy_seconds)."""
+    from models.face_recognition_model import analyze_frame
+
+    if time.time() > deadline:
+        return EXPIRED, 0.0
+
+    start = time.perf_counter()
+    result = analyze_frame(image_bytes, skip_boxes=skip_boxes, regions=regions, **settings)
+    return result, time.perf_counter() - start
+
+
+# --- Request Side ---
+
+class RecognitionEngine:
+    """
+    Runs detection and encoding of uploaded frames on a pool of warmed-up
+    worker processes.
+
+    At most 'workers + queue_size' frames are accepted at once; further frames
+    are rejected with EngineBusy instead of queueing without bound. Each frame
+    carries a deadline, and frames that are still waiting when it passes are
+    dropped without being processed.
+
+    With workers=0 frames are processed inline in the calling thread.
+    Every worker loads the models when it starts; 'dummy_inference' also
+    makes it run one dummy detection and encoding.
+    """
+
+    def __init__(self, settings, workers=None, queue_size=4, timeout=5.0, dummy_inference=False):
+        self.settings = settings
+        self.dummy_inference = dummy_inference
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+
+        self._slots = threading.BoundedSemaphore(max(1, self.workers) + queue_size)
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._started_at = time.time()
+
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.expired = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+
+    def _get_pool(self):
+        # Created on first use, and again after a fork, so each server
+        # worker process gets its own pool
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._pool_lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers, initializer=warm_up_models, initargs=(self.dummy_inference,)
+                    )
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def _discard_pool(self, pool):
+        """Drops a broken pool (a worker died) so the next frame starts a fresh one."""
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def warm_up(self):
+        """
+        Starts every worker process and waits until each has loaded the
+        models (and run its dummy inference), so the first real frame is not
+        slowed down by cold starts.
+        """
+        if self.workers == 0:
+            warm_up_models(self.dummy_inference)
+            return
+
+        pool = self._get_pool()
+        try:
+            # One task per worker at once makes the pool start all of them
+            futures = [pool.submit(_worker_ready) for _ in range(self.workers)]
+            for future in futures:
+                future.result()
+        except BrokenProcessPool:
+            self._discard_pool(pool)
+            raise
+
+    def _count(self, field, amount=1):
+        with self._stats_lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    def process(self, image_bytes, skip_boxes=(), regions=None):
+        """
+        Detects and encodes the faces of one frame; see analyze_frame for
+        the result format and the meaning of skip_boxes and regions. The
+        result's timings also include 'queue', the time the frame waited for
+        a worker and spent in transfer.
+
+        Raises:
+            EngineBusy: The queue is full; the caller should retry later.
+            DeadlineExceeded: The frame was not processed within the timeout.
+            Any error raised while analysing the frame. If a worker process
+            died, the pool is replaced for the next frame.
+        """
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            raise EngineBusy()
+
+        self._count('submitted')
+        self._count('in_flight')
+        deadline = time.time() + self.timeout
+        start = time.perf_counter()
+        try:
+            if self.workers == 0:
+                result, busy = _process_frame(image_bytes, self.settings, skip_boxes, regions, deadline)
+            else:
+                pool = self._get_pool()
+                try:
+                    future = pool.submit(_process_frame, image_bytes, self.settings, skip_boxes, regions, deadline)
+                    result, busy = future.result(timeout=self.timeout)
+                except FutureTimeout:
+                    future.cancel()
+                    self._count('expired')
+                    raise DeadlineExceeded()
+                except BrokenProcessPool:
+                    self._discard_pool(pool)
+                    raise
+        except (EngineBusy, DeadlineExceeded):
+            raise
+        except Exception:
+            self._count('failed')
+            raise
+        finally:
+            self._count('in_flight', -1)
+            self._slots.release()
+
+        if result == EXPIRED:
+            self._count('expired')
+            raise DeadlineExceeded()
+
+        self._count('completed')
+        self._count('busy_seconds', busy)
+        if result is not None:
+            result['timings']['queue'] = max(0.0, time.perf_counter() - start - busy)
+        return result
+
+    def stats(self) -> dict:
+        """Snapshot of queue and worker counters, used to size the pool."""
+        with self._stats_lock:
+            workers = max(1, self.workers)
+            elapsed = max(time.time() - self._started_at, 1e-9)
+            return {
+                'workers': self.workers,
+                'capacity': workers + self.queue_size,
+                'in_flight': self.in_flight,
+                'queue_depth': max(0, self.in_flight - workers),
+                'busy_workers': min(self.in_flight, workers),
+                'utilization': min(1.0, self.busy_seconds / (elapsed * workers)),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'dropped': self.rejected + self.expired,
+                'rejected': self.rejected,
+                'expired': self.expired,
+                'failed': self.failed
+            }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def init_recognition_engine(app):
+    """Creates the app's RecognitionEngine from its config."""
+    config = app.config
+    workers = config['RECOGNITION_WORKERS']
+    engine = RecognitionEngine(
+        settings={
+            'max_dimension': config['MAX_INPUT_DIMENSION'],
+            'detection_scale': config['DETECTION_SCALE'],
+            'model': config['DETECTION_MODEL'],
+            'upsample': config['DETECTION_UPSAMPLE'],
+            'iou_threshold': config['TRACKING_IOU_THRESHOLD'],
+            'quality': quality_settings(config)
+        },
+        workers=None if workers < 0 else workers,
+        queue_size=config['RECOGNITION_QUEUE_SIZE'],
+        timeout=config['RECOGNITION_TIMEOUT'],
+        dummy_inference=config['RECOGNITION_WARMUP']
+    )
+    app.extensions['recognition_engine'] = engine
+    return engine
+
+
+def get_recognition_engine(app) -> RecognitionEngine:
+    return app.extensions['recognition_engine']
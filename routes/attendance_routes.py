@@ -1,16 +1,22 @@
-import io
-import cv2
 import csv
+import time
+import zlib
 import numpy as np
-import face_recognition
 from flask import (
     Blueprint, request, current_app, jsonify, 
-    render_template, send_file, Response
+    render_template, send_file, Response, stream_with_context
 )
-from database import db, Student, Face, Attendance
-from models.face_recognition_model import compare_face
+from database import db, Student, Face, Attendance, Group
+from models.face_recognition_model import compare_faces_batch
 from datetime import datetime, date
-from cache import known_faces_cache  # --- MODIFIED: Import from cache.py ---
+from sqlalchemy import String, and_, cast, func, select
+from cache import get_known_faces
+from recognition_engine import get_recognition_engine, EngineBusy, DeadlineExceeded
+from attendance_writer import get_attendance_marker
+from models.face_tracker import get_tracker_registry
+from models.motion_gate import frame_thumbnail, STATIC, FULL
+from metrics import metrics, record_stage, timed
+from readiness import get_readiness
 
 bp = Blueprint('attendance', __name__)
 
@@ -18,6 +24,7 @@ bp = Blueprint('attendance', __name__)
 @bp.route('/')
 def index():
     # ... (code is unchanged)
+    get_attendance_marker(current_app).flush()
     today = date.today()
     total_students = Student.query.count()
     students_present_today = db.session.query(Attendance.student_id).filter(
@@ -34,7 +41,8 @@ def index():
 def attendance_page():
     # ... (code is unchanged)
     today = date.today()
-    return render_template('attendance.html', today=today)
+    groups = Group.query.order_by(Group.name).all()
+    return render_template('attendance.html', today=today, groups=groups)
 
 @bp.route('/reports')
 def reports_page():
@@ -44,95 +52,266 @@ def reports_page():
 # --- API Routes ---
 @bp.route('/api/recognize', methods=['POST'])
 def recognize():
-    # ... (file reading logic is unchanged)
+    """
+    API endpoint to recognize the faces in one webcam frame and mark attendance.
+
+    Frames sent with a 'camera_id' form field are tracked across frames, so
+    faces that stay in place reuse their previous encoding and identity, and
+    frames without motion reuse the previous results entirely.
+
+    With a 'group_id' form field only that group's students are matched and
+    marked.
+    """
     file = request.files.get('image')
     if file is None:
         return jsonify({'error': 'no image uploaded'}), 400
 
-    try:
-        in_memory = file.read()
-        arr = np.frombuffer(in_memory, np.uint8)
-        img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-        if img is None:
-            return jsonify({'error': 'could not decode image'}), 400
-        
-        rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-        face_locations = face_recognition.face_locations(rgb_img)
-        live_encodings = face_recognition.face_encodings(rgb_img, face_locations)
-
-        # --- MODIFIED: Use the imported cache ---
-        if not known_faces_cache['encodings']:
-            current_app.logger.warning("Face cache is empty. No faces to recognize.")
-            return jsonify({'results': [], 'locations': face_locations})
-
-        known_encodings = known_faces_cache['encodings']
-        known_student_ids = known_faces_cache['student_ids']
-        known_names = known_faces_cache['names']
-        # ------------------------------------------
-
-        results = []
-        today = date.today()
-
-        for (top, right, bottom, left), live_encoding in zip(face_locations, live_encodings):
-            match_idx, confidence = compare_face(known_encodings, live_encoding, tolerance=0.5)
-            
-            name = "Unknown"
-            student_pk = None
-            
-            if match_idx is not None:
-                name = known_names[match_idx]
-                student_pk = known_student_ids[match_idx]
+    payload, status, headers = recognize_frame(
+        file.read(), request.form.get('camera_id'), request.form.get('group_id', type=int)
+    )
+    return jsonify(payload), status, headers
+
+def _match_encodings(gallery, encodings, group_id=None):
+    """
+    Matches live encodings against the gallery, or only against one group's
+    roster.
+
+    Returns:
+        A tuple (rows, distances); rows index the gallery, -1 for no match.
+    """
+    view = gallery.roster_view(group_id) if group_id is not None else None
+    if view is not None:
+        roster_encodings, roster_sq_norms, roster_rows = view
+        match_indices, distances = compare_faces_batch(
+            roster_encodings, encodings, tolerance=0.5, known_sq_norms=roster_sq_norms
+        )
+        rows = np.full(match_indices.shape, -1, dtype=np.int64)
+        hit = match_indices >= 0
+        rows[hit] = roster_rows[match_indices[hit]]
+        return rows, distances
+
+    rows, distances = compare_faces_batch(
+        gallery.encodings, encodings,
+        tolerance=0.5, known_sq_norms=gallery.sq_norms, index=gallery.index
+    )
+    if group_id is not None:
+        # A large group is matched against everyone; only its members count
+        hit = rows >= 0
+        members = np.isin(gallery.student_ids[rows[hit]], gallery.groups[group_id])
+        rows[np.nonzero(hit)[0][~members]] = -1
+    return rows, distances
+
+def recognize_frame(image_bytes, camera_id=None, group_id=None):
+    """
+    Recognizes the faces in one encoded frame and marks attendance. Shared by
+    the per-frame POST endpoint and the streaming channel.
+
+    Returns:
+        A tuple (payload, status, headers) for the response.
+    """
+    if not get_readiness(current_app).gallery_loaded:
+        # Without the gallery every face would come back as unknown
+        retry_after = str(current_app.config['RECOGNITION_RETRY_AFTER'])
+        return {'error': 'face gallery is still loading'}, 503, {'Retry-After': retry_after}
+
+    if group_id is not None and group_id not in get_known_faces().groups:
+        return {'error': f'unknown group {group_id}'}, 404, {}
+
+    registry = get_tracker_registry(current_app)
+    # Without a camera id every frame gets a fresh tracker, i.e. no reuse.
+    # A camera switching groups gets a separate tracker, so identities
+    # matched against one roster are never reused for another.
+    if camera_id:
+        tracker = registry.get(camera_id if group_id is None else f'{camera_id}@group{group_id}')
+    else:
+        tracker = registry.new_tracker()
+
+    engine = get_recognition_engine(current_app)
+    with tracker.lock:
+        # Cheap thumbnail diff decides whether detection is needed at all
+        decision, regions, thumb = FULL, None, None
+        if tracker.motion_gate is not None:
+            with timed('recognize', 'motion'):
+                thumb = frame_thumbnail(image_bytes)
+                if thumb is not None:
+                    decision, regions = tracker.motion_gate.check(thumb)
+
+        # Results matched against an older gallery (a student added or
+        # deleted since) are not replayed; the frame is analysed again
+        if decision == STATIC and tracker.last_results is not None \
+                and tracker.last_gallery_version == get_known_faces().version:
+            registry.record(0, 0, STATIC)
+            return {
+                'results': tracker.last_results,
+                'detection_scale': tracker.last_detection_scale,
+                'motion': STATIC
+            }, 200, {}
+        if decision == STATIC:
+            decision = FULL
+
+        reusable = tracker.reusable_tracks()
+        try:
+            frame = engine.process(image_bytes, skip_boxes=[t.box for t in reusable], regions=regions)
+        except (EngineBusy, DeadlineExceeded) as e:
+            # Shed load instead of letting frames pile up behind the workers
+            reason = 'recognition queue is full' if isinstance(e, EngineBusy) else 'recognition timed out'
+            retry_after = str(current_app.config['RECOGNITION_RETRY_AFTER'])
+            return {'error': reason}, 503, {'Retry-After': retry_after}
+        except Exception as e:
+            current_app.logger.error(f'Recognition error: {e}')
+            return {'error': str(e)}, 500, {}
+
+        try:
+            if frame is None:
+                return {'error': 'could not decode image'}, 400, {}
+
+            # Stages that ran in the worker process
+            for stage, seconds in frame['timings'].items():
+                record_stage('recognize', stage, seconds)
+
+            face_locations = frame['locations']
+            used_scale = frame['detection_scale']
+            tracks = tracker.update(face_locations, frame['reused'], frame['encodings'], reusable, regions=regions)
+            registry.record(len(face_locations) + len(frame['low_quality']), len(frame['encodings']), decision)
+
+            # Faces rejected by the quality gate were never encoded
+            low_quality = []
+            for face in frame['low_quality']:
+                metrics.inc('face_quality_rejected_total', path='recognize', reason=face['reason'])
+                low_quality.append({
+                    'name': 'Low quality',
+                    'confidence': None,
+                    'quality': face['reason'],
+                    'location': list(face['location'])
+                })
+            if thumb is not None:
+                tracker.motion_gate.commit(thumb, decision)
+
+            # Take one snapshot so a concurrent reload can't change it mid-request
+            gallery = get_known_faces()
+            if len(gallery) == 0:
+                current_app.logger.warning("Face cache is empty. No faces to recognize.")
+                return {'results': low_quality, 'locations': face_locations, 'detection_scale': used_scale}, 200, {}
+
+            # Only new or re-encoded tracks, or tracks matched against an older
+            # gallery, need matching
+            unmatched = [t for t in tracks if t.gallery_version != gallery.version]
+            if unmatched:
+                with timed('recognize', 'match'):
+                    match_indices, distances = _match_encodings(gallery, [t.encoding for t in unmatched], group_id)
+                for track, match_idx, distance in zip(unmatched, match_indices, distances):
+                    track.distance = float(distance)
+                    track.gallery_version = gallery.version
+                    if match_idx >= 0:
+                        track.student_pk = int(gallery.student_ids[match_idx])
+                        track.name = gallery.names[match_idx]
+                    else:
+                        track.student_pk = None
+                        track.name = None
+
+            results = []
+            marker = get_attendance_marker(current_app)
+
+            mark_start = time.perf_counter()
+            for track in tracks:
+                name = "Unknown"
                 
-                already_marked = Attendance.query.filter(
-                    Attendance.student_id == student_.pk,
-                    Attendance.date == today
-                ).first()
-
-                if not already_marked:
-                    try:
-                        att = Attendance(student_id=student_pk, date=today, timestamp=datetime.utcnow())
-                        db.session.add(att)
-                        db.session.commit()
+                if track.student_pk is not None:
+                    name = track.name
+                    # Already-marked students cost no database work; new marks
+                    # are written in the background
+                    if marker.mark(track.student_pk, group_id):
                         name = f"{name} (Marked)"
-                    except Exception as e:
-                        db.session.rollback()
-                        current_app.logger.error(f'Error marking attendance: {e}')
 
-            results.append({
-                'name': name,
-                'confidence': f"{confidence * 100:.2f}%",
-                'location': [top, right, bottom, left]
-            })
+                results.append({
+                    'name': name,
+                    'confidence': f"{(1.0 - track.distance) * 100:.2f}%",
+                    'location': list(track.box)
+                })
 
-        return jsonify({'results': results})
+            record_stage('recognize', 'mark', time.perf_counter() - mark_start)
 
-    except Exception as e:
-        current_app.logger.error(f'Recognition error: {e}')
-        return jsonify({'error': str(e)}), 500
+            # Replayed for frames without motion, minus the one-off "(Marked)"
+            tracker.last_results = [
+                dict(r, name=t.name if t.student_pk is not None else "Unknown")
+                for r, t in zip(results, tracks)
+            ] + low_quality
+            tracker.last_detection_scale = used_scale
+            tracker.last_gallery_version = gallery.version
+
+            return {'results': results + low_quality, 'detection_scale': used_scale, 'motion': decision}, 200, {}
+
+        except Exception as e:
+            current_app.logger.error(f'Recognition error: {e}')
+            return {'error': str(e)}, 500, {}
+
+@bp.route('/api/engine/stats')
+def engine_stats():
+    """API endpoint exposing recognition queue depth, utilization and dropped frames."""
+    stats = get_recognition_engine(current_app).stats()
+    stats['tracking'] = get_tracker_registry(current_app).stats()
+    return jsonify(stats)
 
 # ... (rest of the file is unchanged) ...
 @bp.route('/api/attendance/today')
 def get_today_attendance():
-    """API endpoint to get all attendance records for today."""
+    """
+    API endpoint to get all attendance records for today, newest first.
+
+    Supports cheap polling:
+    - 'since': Only records with an id greater than this are returned.
+    - If-None-Match: Answered with 304 and no database work when nobody
+      was marked since the ETag was issued.
+    """
+    marker = get_attendance_marker(current_app)
+    etag = marker.etag()
     today = date.today()
-    records = db.session.query(Attendance, Student).join(Student).filter(
-        Attendance.date == today
-    ).order_by(Attendance.timestamp.desc()).all()
-    
+    headers = {'X-Attendance-Date': today.isoformat()}
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
+        response.set_etag(etag)
+        return response
+
+    # Write out queued marks so they show up right away
+    marker.flush()
+    query = db.session.query(
+        Attendance.id, Attendance.timestamp, Student.name, Student.student_id
+    ).join(Student).filter(Attendance.date == today)
+
+    since = request.args.get('since', type=int)
+    if since is not None:
+        query = query.filter(Attendance.id > since)
+
     results = [
         {
-            'name': student.name,
-            'student_id': student.student_id,
-            'time': att.timestamp.strftime('%I:%M:%S %p')
+            'id': att_id,
+            'name': name,
+            'student_id': student_id,
+            'time': timestamp.strftime('%I:%M:%S %p')
         }
-        for att, student in records
+        for att_id, timestamp, name, student_id in query.order_by(Attendance.timestamp.desc())
     ]
-    return jsonify(results)
+    response = jsonify(results)
+    response.headers.update(headers)
+    response.set_etag(etag)
+    return response
+
+def _date_list(column):
+    """Aggregate that joins a group's dates into one comma-separated string."""
+    if db.engine.dialect.name == 'postgresql':
+        return func.string_agg(cast(column, String), ',')
+    return func.group_concat(column)
 
 @bp.route('/api/reports')
 def get_reports_data():
-    """API endpoint to get attendance data for a date range."""
+    """
+    API endpoint to get attendance data for a date range.
+
+    Counts and dates for every student come from one grouped query. Pass
+    'page' (and optionally 'per_page') to fetch the roster in pages; the
+    total number of students is then sent in the X-Total-Count header.
+    """
     try:
         start_date_str = request.args.get('start_date')
         end_date_str = request.args.get('end_date')
@@ -140,65 +319,137 @@ def get_reports_data():
         start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
         end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
 
-        students = Student.query.all()
-        report_data = []
+        page = request.args.get('page', type=int)
+        # Clamped to 1-5000; a negative LIMIT would mean no limit at all in SQLite
+        per_page = max(1, min(request.args.get('per_page', 500, type=int), 5000))
+
+        in_range = and_(
+            Attendance.student_id == Student.id,
+            Attendance.date >= start_date,
+            Attendance.date <= end_date
+        )
+        query = db.session.query(
+            Student.id,
+            Student.student_id,
+            Student.name,
+            func.count(Attendance.id),
+            _date_list(Attendance.date)
+        ).outerjoin(Attendance, in_range).group_by(
+            Student.id, Student.student_id, Student.name
+        ).order_by(Student.name, Student.id)
+
+        headers = {}
+        if page is not None:
+            page = max(page, 1)
+            query = query.limit(per_page).offset((page - 1) * per_page)
+            headers['X-Total-Count'] = str(Student.query.count())
 
-        for s in students:
-            records = Attendance.query.filter(
-                Attendance.student_id == s.id,
-                Attendance.date >= start_date,
-                Attendance.date <= end_date
-            ).all()
-            
-            present_dates = {r.date.isoformat() for r in records}
+        report_data = []
+        for pk, student_id, name, present_count, dates in query:
+            # The unique constraint guarantees one row per student per day
             report_data.append({
-                'id': s.id,
-                'student_id': s.student_id,
-                'name': s.name,
-                'present_count': len(present_dates),
-                'present_dates': list(present_dates)
+                'id': pk,
+                'student_id': student_id,
+                'name': name,
+                'present_count': present_count,
+                'present_dates': sorted(dates.split(',')) if dates else []
             })
         
-        return jsonify(report_data)
+        return jsonify(report_data), 200, headers
 
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+class _CsvBuffer:
+    """Write target for csv.writer that hands back what was written since the last drain."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def drain(self):
+        text = ''.join(self.parts)
+        self.parts = []
+        return text
+
+def _stream_csv(rows, chunk_rows=1000, compress=False):
+    """
+    Yields CSV text for 'rows' in chunks of roughly chunk_rows lines,
+    optionally gzip-compressed, so memory stays flat for any range size.
+    """
+    buffer = _CsvBuffer()
+    writer = csv.writer(buffer)
+    gzipper = zlib.compressobj(wbits=31) if compress else None
+
+    def emit(text):
+        data = text.encode('utf-8')
+        return gzipper.compress(data) if gzipper else data
+
+    writer.writerow(['Student Name', 'Student ID', 'Date', 'Time', 'Status'])
+    # Send the header right away so the download starts immediately
+    yield emit(buffer.drain())
+
+    for i, (name, student_id, att_date, timestamp, status) in enumerate(rows, 1):
+        writer.writerow([
+            name,
+            student_id,
+            att_date.isoformat(),
+            timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+            status
+        ])
+        if i % chunk_rows == 0:
+            chunk = emit(buffer.drain())
+            if chunk:
+                yield chunk
+
+    tail = emit(buffer.drain())
+    if gzipper:
+        tail += gzipper.flush()
+    if tail:
+        yield tail
+
 @bp.route('/api/reports/export')
 def export_csv():
-    """API endpoint to export a CSV report for a date range."""
+    """
+    API endpoint to export a CSV report for a date range.
+
+    The file is streamed from a server-side cursor over plain columns; pass
+    gzip=1 for a gzip-compressed download.
+    """
     try:
         start_date_str = request.args.get('start_date')
         end_date_str = request.args.get('end_date')
 
         start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
         end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
 
-        records = db.session.query(Attendance, Student).join(Student).filter(
-            Attendance.date >= start_date,
-            Attendance.date <= end_date
-        ).order_by(Attendance.date, Student.name, Attendance.timestamp).all()
-
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Student Name', 'Student ID', 'Date', 'Time', 'Status'])
-
-        for att, student in records:
-            writer.writerow([
-                student.name,
-                student.student_id,
-                att.date.isoformat(),
-                att.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                att.status
-            ])
-
-        output.seek(0)
-        
-        return Response(
-            output,
-            mimetype="text/csv",
-            headers={"Content-Disposition": f"attachment;filename=attendance_report_{start_date_str}_to_{end_date_str}.csv"}
-        )
+    compress = request.args.get('gzip', '0').lower() in ('1', 'true', 'yes')
 
-    except Exception as e:
-        return jsonify({'error': str(e)}), 400
\ No newline at end of file
+    query = select(
+        Student.name,
+        Student.student_id,
+        Attendance.date,
+        Attendance.timestamp,
+        Attendance.status
+    ).join(Student, Attendance.student_id == Student.id).where(
+        Attendance.date >= start_date,
+        Attendance.date <= end_date
+    ).order_by(Attendance.date, Student.name, Attendance.timestamp).execution_options(yield_per=1000)
+
+    def generate():
+        rows = db.session.execute(query)
+        yield from _stream_csv(rows, compress=compress)
+
+    filename = f"attendance_report_{start_date_str}_to_{end_date_str}.csv"
+    if compress:
+        filename += '.gz'
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/gzip' if compress else 'text/csv',
+        headers={"Content-Disposition": f"attachment;filename={filename}"}
+    )
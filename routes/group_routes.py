@@ -0,0 +1,94 @@
+from flask import Blueprint, request, jsonify
+from database import db, Student, Group, Attendance, bump_gallery_version
+from cache import face_gallery, gallery_update
+
+bp = Blueprint('group', __name__)
+
+def _roster_students(student_ids):
+    """
+    Looks up the students of a roster by their student_id.
+
+    Returns:
+        A tuple (students, unknown_ids).
+    """
+    students = Student.query.filter(Student.student_id.in_(student_ids)).all() if student_ids else []
+    found = {s.student_id for s in students}
+    return students, [sid for sid in student_ids if sid not in found]
+
+def _set_roster(group, students):
+    """Commits a new or existing group with its roster and publishes it to the face gallery."""
+    with gallery_update():
+        # Nothing is written before the gallery lock is held: a write
+        # transaction waiting for it would block the process holding it
+        db.session.add(group)
+        group.students = students
+        bump_gallery_version()
+        db.session.commit()
+        face_gallery.set_group(group.id, [s.id for s in students])
+
+@bp.route('/api/groups', methods=['GET'])
+def list_groups():
+    """API endpoint to get a list of all groups."""
+    groups = Group.query.order_by(Group.name).all()
+    return jsonify([g.to_dict() for g in groups])
+
+@bp.route('/api/groups', methods=['POST'])
+def create_group():
+    """
+    API endpoint to create a group, e.g. a class or section.
+    Expects JSON {"name": ..., "student_ids": [...]}; the roster is optional.
+    """
+    data = request.get_json(silent=True) or {}
+    name = (data.get('name') or '').strip()
+    if not name:
+        return jsonify({'error': 'Group name is required.'}), 400
+    if Group.query.filter_by(name=name).first():
+        return jsonify({'error': f'Group {name} already exists.'}), 400
+
+    students, unknown = _roster_students(data.get('student_ids') or [])
+    if unknown:
+        return jsonify({'error': 'Unknown student IDs.', 'unknown': unknown}), 400
+
+    group = Group(name=name)
+    _set_roster(group, students)
+    return jsonify(group.to_dict(include_students=True)), 201
+
+@bp.route('/api/groups/<int:id>', methods=['GET'])
+def get_group(id):
+    """API endpoint to get a group with its roster."""
+    group = Group.query.get_or_404(id)
+    return jsonify(group.to_dict(include_students=True))
+
+@bp.route('/api/groups/<int:id>/members', methods=['PUT'])
+def set_group_members(id):
+    """
+    API endpoint to replace a group's roster.
+    Expects JSON {"student_ids": [...]}.
+    """
+    group = Group.query.get_or_404(id)
+    data = request.get_json(silent=True) or {}
+    student_ids = data.get('student_ids')
+    if not isinstance(student_ids, list):
+        return jsonify({'error': 'student_ids must be a list.'}), 400
+
+    students, unknown = _roster_students(student_ids)
+    if unknown:
+        return jsonify({'error': 'Unknown student IDs.', 'unknown': unknown}), 400
+
+    _set_roster(group, students)
+    return jsonify(group.to_dict(include_students=True))
+
+@bp.route('/api/groups/<int:id>', methods=['DELETE'])
+def delete_group(id):
+    """API endpoint to delete a group. Its students and attendance records are kept."""
+    group = Group.query.get_or_404(id)
+    name = group.name
+
+    with gallery_update():
+        db.session.query(Attendance).filter(Attendance.group_id == id).update({'group_id': None})
+        db.session.delete(group)
+        bump_gallery_version()
+        db.session.commit()
+        face_gallery.delete_group(id)
+
+    return jsonify({'success': True, 'message': f'Group {name} deleted.'})
@@ -0,0 +1,15 @@
+from flask import Blueprint, current_app, jsonify
+from readiness import get_readiness
+
+bp = Blueprint('health', __name__)
+
+@bp.route('/healthz')
+def healthz():
+    """Liveness probe: the process is up and serving requests."""
+    return jsonify({'status': 'ok'})
+
+@bp.route('/readyz')
+def readyz():
+    """Readiness probe: the gallery and the recognition models are loaded."""
+    state = get_readiness(current_app).to_dict()
+    return jsonify(state), 200 if state['ready'] else 503
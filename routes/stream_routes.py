@@ -0,0 +1,130 @@
+import json
+import struct
+from flask import current_app, g
+from database import db
+from routes.attendance_routes import recognize_frame
+
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
+
+# Binary frame message: frame id and JPEG length (uint32, big endian), then the JPEG
+FRAME_HEADER = struct.Struct('>II')
+
+
+def _parse_frame(message, max_bytes):
+    """
+    Splits a binary frame message into (frame_id, jpeg_bytes).
+
+    Raises:
+        ValueError: The message is truncated, oversized or its length prefix is wrong.
+    """
+    if len(message) < FRAME_HEADER.size:
+        raise ValueError('frame message too short')
+    frame_id, length = FRAME_HEADER.unpack_from(message)
+    if length > max_bytes:
+        raise ValueError(f'frame larger than {max_bytes} bytes')
+    if len(message) - FRAME_HEADER.size != length:
+        raise ValueError('frame length does not match its header')
+    return frame_id, message[FRAME_HEADER.size:]
+
+
+def _send(ws, payload):
+    ws.send(json.dumps(payload))
+
+
+def stream_recognition(ws):
+    """
+    Persistent recognition channel for one camera.
+
+    Protocol:
+        - Text messages are JSON settings, e.g. {"camera_id": "cam-1"} or
+          {"camera_id": "cam-1", "group_id": 3} to match one roster. The
+          server answers each with {"type": "ready", "max_dimension": ...}
+          so the client can pick its frame size and JPEG quality.
+        - Binary messages are frames: FRAME_HEADER followed by the JPEG.
+        - Every frame gets exactly one reply carrying its frame_id: a
+          "result" with the same fields as /api/recognize, an "error", or
+          "dropped" when a newer frame arrived before this one was started.
+
+    Only the newest waiting frame is processed, so when recognition falls
+    behind the camera, latency stays at about one frame instead of growing.
+    """
+    # The connection's lifetime is not a request latency
+    g.skip_request_metrics = True
+
+    max_bytes = current_app.config['STREAM_MAX_FRAME_BYTES']
+    camera_id = None
+    group_id = None
+
+    while True:
+        # Block for one message, then drain whatever else is already queued
+        messages = [ws.receive()]
+        while True:
+            queued = ws.receive(timeout=0)
+            if queued is None:
+                break
+            messages.append(queued)
+
+        frames = []
+        for message in messages:
+            if isinstance(message, str):
+                try:
+                    settings = json.loads(message)
+                    camera_id = settings.get('camera_id') or camera_id
+                    if 'group_id' in settings:
+                        group_id = None if settings['group_id'] is None else int(settings['group_id'])
+                except (ValueError, TypeError, AttributeError):
+                    _send(ws, {'type': 'error', 'error': 'settings must be a JSON object'})
+                    continue
+                _send(ws, {'type': 'ready', 'max_dimension': current_app.config['MAX_INPUT_DIMENSION']})
+                continue
+
+            try:
+                frames.append(_parse_frame(message, max_bytes))
+            except ValueError as e:
+                reply = {'type': 'error', 'error': str(e)}
+                if len(message) >= FRAME_HEADER.size:
+                    reply['frame_id'] = FRAME_HEADER.unpack_from(message)[0]
+                _send(ws, reply)
+
+        if not frames:
+            continue
+
+        for frame_id, _ in frames[:-1]:
+            _send(ws, {'type': 'dropped', 'frame_id': frame_id})
+
+        frame_id, jpeg = frames[-1]
+        try:
+            payload, status, headers = recognize_frame(jpeg, camera_id, group_id)
+        finally:
+            # Don't hold a database connection for the life of the socket
+            db.session.remove()
+
+        if status == 200:
+            _send(ws, dict(payload, type='result', frame_id=frame_id))
+        else:
+            reply = {'type': 'error', 'frame_id': frame_id, 'error': payload.get('error'), 'status': status}
+            if 'Retry-After' in headers:
+                reply['retry_after'] = int(headers['Retry-After'])
+            _send(ws, reply)
+
+
+def init_stream_routes(app):
+    """
+    Registers the WebSocket recognition channel at /ws/recognize. Needs the
+    optional flask-sock package; without it clients keep using /api/recognize.
+    """
+    if Sock is None:
+        app.logger.info('flask-sock is not installed; streaming recognition is disabled.')
+        return None
+
+    app.config.setdefault('SOCK_SERVER_OPTIONS', {
+        'ping_interval': 25,
+        'max_message_size': app.config['STREAM_MAX_FRAME_BYTES'] + FRAME_HEADER.size
+    })
+    sock = Sock(app)
+    sock.route('/ws/recognize')(stream_recognition)
+    app.extensions['stream_sock'] = sock
+    return sock
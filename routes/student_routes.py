@@ -4,10 +4,12 @@ from flask import (
     current_app, redirect, url_for
 )
 from werkzeug.utils import secure_filename
-from database import db, Student, Face
-from models.face_recognition_model import allowed_file, load_image_file, encode_face_from_image
+from database import db, Student, bump_gallery_version
+from models.face_recognition_model import allowed_file
 from datetime import datetime
-from cache import load_known_faces  # --- MODIFIED: Import from cache.py ---
+from cache import face_gallery, gallery_update
+from enrollment import get_enrollment_manager
+from attendance_writer import get_attendance_marker
 
 bp = Blueprint('student', __name__)
 
@@ -28,73 +30,66 @@ def list_students():
     students = Student.query.all()
     return jsonify([s.to_dict() for s in students])
 
+def _wants_json():
+    """True for script clients that asked for a JSON response instead of a redirect."""
+    return request.accept_mimetypes.best == 'application/json'
+
+def _registration_error(message):
+    if _wants_json():
+        return jsonify({'error': message}), 400
+    return redirect(url_for('student.register_page', error=message))
+
 @bp.route('/api/students', methods=['POST'])
 def create_student():
-    """API endpoint to register a new student and their face images."""
+    """
+    API endpoint to register a new student and their face images.
+
+    The images are encoded in the background; JSON clients get 202 with a
+    job id to poll at /students/api/jobs/<id>, form posts are redirected to
+    the student list right away.
+    """
     name = request.form.get('name')
     student_id = request.form.get('student_id')
     email = request.form.get('email')
 
     if not name or not student_id:
-        return redirect(url_for('student.register_page', error='Name and Student ID are required.'))
+        return _registration_error('Name and Student ID are required.')
+
+    manager = get_enrollment_manager(current_app)
 
-    # Check for existing student
+    # Check for existing student, or one still being registered
     existing = Student.query.filter_by(student_id=student_id).first()
-    if existing:
-        return redirect(url_for('student.register_page', error=f'Student ID {student_id} already exists.'))
+    if existing or manager.in_progress(student_id):
+        return _registration_error(f'Student ID {student_id} already exists.')
 
-    # Create student entry
-    s = Student(name=name, student_id=student_id, email=email)
-    db.session.add(s)
-    db.session.commit() # Commit to get the student's primary key (s.id)
+    files = [f for f in request.files.getlist('images') if f and allowed_file(f.filename)]
+    if not files:
+        return _registration_error('Registration failed. No valid images uploaded.')
 
-    # Handle image uploads
-    files = request.files.getlist('images')
-    upload_folder = current_app.config['UPLOAD_FOLDER']
-    
-    face_encodings_added = 0
+    # Images are decoded straight from the upload bytes, never read back from disk.
+    # The student is created by the job, together with their faces
+    uploads = []
     for f in files:
-        if f and allowed_file(f.filename):
-            # Use student's primary key for a cleaner filename
-            filename = secure_filename(f"{s.id}_{student_id}_{datetime.utcnow().timestamp()}_{f.filename}")
-            filepath = os.path.join(upload_folder, filename)
-            f.save(filepath)
-            
-            # Encode the face
-            try:
-                img = load_image_file(filepath)
-                enc = encode_face_from_image(img)
-                
-                if enc is None:
-                    # No face found, delete the image
-                    os.remove(filepath)
-                    current_app.logger.warning(f'No face found in {filename}, file deleted.')
-                    continue
-                    
-                # Save the face encoding to the database
-                face = Face(filename=filename, encoding=enc, student=s)
-                db.session.add(face)
-                face_encodings_added += 1
-
-            except Exception as e:
-                current_app.logger.error(f'Error processing image {filename}: {e}')
-                if os.path.exists(filepath):
-                    os.remove(filepath) # Clean up failed file
-
-    if face_encodings_added == 0:
-        # No valid faces were added, roll back student creation
-        db.session.delete(s)
-        db.session.commit()
-        return redirect(url_for('student.register_page', error='Registration failed. No valid faces detected in uploaded images.'))
+        filename = secure_filename(f"{student_id}_{datetime.utcnow().timestamp()}_{f.filename}")
+        uploads.append((filename, f.read()))
 
-    db.session.commit()
-    
-    # --- MODIFIED: Call the imported function ---
-    load_known_faces()
-    # ----------------------------------------
-    
+    job = manager.submit(student_id, name, email or None, uploads)
+
+    if _wants_json():
+        return jsonify({
+            'job_id': job.id,
+            'status_url': url_for('student.get_job', job_id=job.id)
+        }), 202
     return redirect(url_for('student.students_page'))
 
+@bp.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """API endpoint reporting the per-image progress of an enrollment job."""
+    job = get_enrollment_manager(current_app).get(job_id)
+    if job is None:
+        return jsonify({'error': 'job not found'}), 404
+    return jsonify(job.to_dict())
+
 @bp.route('/api/students/<int:id>', methods=['DELETE'])
 def delete_student(id):
     """API endpoint to delete a student and their associated data."""
@@ -110,11 +105,12 @@ def delete_student(id):
             current_app.logger.error(f'Could not delete file {face.filename}: {e}')
             
     # Database will cascade delete face encodings and attendance records
-    db.session.delete(s)
-    db.session.commit()
-    
-    # --- MODIFIED: Call the imported function ---
-    load_known_faces()
-    # ----------------------------------------
+    with gallery_update():
+        db.session.delete(s)
+        bump_gallery_version()
+        db.session.commit()
+        face_gallery.remove(id)
+    # Freed primary keys are reused; a new student with this one must not look marked
+    get_attendance_marker(current_app).forget(id)
     
     return jsonify({'success': True, 'message': f'Student {s.name} deleted.'})
\ No newline at end of file
@@ -6,10 +6,27 @@ document.addEventListener('DOMContentLoaded', () => {
     const attendanceList = document.getElementById('attendance-list');
     const startCamBtn = document.getElementById('start-cam');
     const stopCamBtn = document.getElementById('stop-cam');
+    const groupSelect = document.getElementById('group-select');
     
     let stream = null;
     let intervalId = null;
     let processing = false;
+    let lastPostTime = 0;
+    // Lets the server track faces across this page's frames
+    const cameraId = `cam-${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+
+    // Frames go over a persistent WebSocket when the server offers one
+    // (/ws/recognize), otherwise as one POST per second
+    const STREAM_FPS = 4;
+    const STREAM_FRAME_WIDTH = 640;
+    const STREAM_JPEG_QUALITY = 0.7;
+    const STREAM_MAX_IN_FLIGHT = 2;
+    const frameCanvas = document.createElement('canvas');
+    let socket = null;
+    let socketReady = false;
+    let nextFrameId = 1;
+    let lastShownFrameId = 0;
+    let framesInFlight = 0;
 
     if (startCamBtn) {
         startCamBtn.addEventListener('click', startWebcam);
@@ -17,6 +34,22 @@ document.addEventListener('DOMContentLoaded', () => {
     if (stopCamBtn) {
         stopCamBtn.addEventListener('click', stopWebcam);
     }
+    if (groupSelect) {
+        // Tell an open stream about the new roster; POSTs read it per frame
+        groupSelect.addEventListener('change', () => {
+            if (socket && socket.readyState === WebSocket.OPEN) {
+                socket.send(JSON.stringify(streamSettings()));
+            }
+        });
+    }
+
+    function selectedGroupId() {
+        return groupSelect && groupSelect.value ? parseInt(groupSelect.value, 10) : null;
+    }
+
+    function streamSettings() {
+        return { camera_id: cameraId, group_id: selectedGroupId() };
+    }
 
     async function startWebcam() {
         if (stream) return; // Already running
@@ -32,7 +65,8 @@ document.addEventListener('DOMContentLoaded', () => {
                 canvas.width = video.videoWidth;
                 canvas.height = video.videoHeight;
                 // Start sending frames
-                intervalId = setInterval(sendFrame, 1000); // Send 1 frame per second
+                openStream();
+                intervalId = setInterval(sendFrame, 1000 / STREAM_FPS);
                 updateTodayAttendance(); // Initial load
             };
         } catch (err) {
@@ -50,6 +84,11 @@ document.addEventListener('DOMContentLoaded', () => {
             clearInterval(intervalId);
             intervalId = null;
         }
+        if (socket) {
+            socket.close();
+            socket = null;
+            socketReady = false;
+        }
         video.srcObject = null;
         startCamBtn.disabled = false;
         stopCamBtn.disabled = true;
@@ -59,7 +98,98 @@ document.addEventListener('DOMContentLoaded', () => {
         context.clearRect(0, 0, canvas.width, canvas.height);
     }
 
-    async function sendFrame() {
+    function openStream() {
+        if (!('WebSocket' in window)) return;
+        const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        const ws = new WebSocket(`${protocol}://${window.location.host}/ws/recognize`);
+        ws.binaryType = 'arraybuffer';
+        ws.onopen = () => ws.send(JSON.stringify(streamSettings()));
+        ws.onmessage = (event) => handleStreamMessage(JSON.parse(event.data));
+        // Until 'ready' arrives, or after the socket closes, frames are POSTed
+        ws.onclose = () => {
+            if (socket === ws) {
+                socket = null;
+                socketReady = false;
+                framesInFlight = 0;
+            }
+        };
+        socket = ws;
+    }
+
+    function handleStreamMessage(msg) {
+        if (msg.type === 'ready') {
+            // Frames are sent downscaled; results are scaled back for drawing
+            const width = Math.min(STREAM_FRAME_WIDTH, msg.max_dimension || Infinity, canvas.width);
+            frameCanvas.width = width;
+            frameCanvas.height = Math.round(canvas.height * width / canvas.width);
+            socketReady = true;
+            return;
+        }
+
+        if (msg.frame_id !== undefined) {
+            framesInFlight = Math.max(0, framesInFlight - 1);
+        }
+        if (msg.type === 'result' && msg.frame_id > lastShownFrameId) {
+            lastShownFrameId = msg.frame_id;
+            showResults(msg.results, canvas.width / frameCanvas.width);
+        } else if (msg.type === 'error') {
+            console.error('Error processing frame:', msg.error);
+        }
+    }
+
+    function sendFrame() {
+        if (!stream) return;
+        if (socketReady) {
+            sendStreamFrame();
+        } else if (Date.now() - lastPostTime >= 1000) {
+            lastPostTime = Date.now();
+            postFrame();
+        }
+    }
+
+    function sendStreamFrame() {
+        // The server only processes the newest waiting frame, so there is no
+        // point queueing more than a couple
+        if (framesInFlight >= STREAM_MAX_IN_FLIGHT) return;
+
+        const frameId = nextFrameId++;
+        framesInFlight++;
+        frameCanvas.getContext('2d').drawImage(video, 0, 0, frameCanvas.width, frameCanvas.height);
+
+        frameCanvas.toBlob(async (blob) => {
+            const jpeg = new Uint8Array(await blob.arrayBuffer());
+            // 8-byte header: frame id and JPEG length, big endian
+            const message = new Uint8Array(8 + jpeg.byteLength);
+            const header = new DataView(message.buffer);
+            header.setUint32(0, frameId);
+            header.setUint32(4, jpeg.byteLength);
+            message.set(jpeg, 8);
+
+            if (socket && socketReady && socket.readyState === WebSocket.OPEN) {
+                socket.send(message.buffer);
+            } else {
+                framesInFlight = Math.max(0, framesInFlight - 1);
+            }
+        }, 'image/jpeg', STREAM_JPEG_QUALITY);
+    }
+
+    function showResults(results, scale = 1) {
+        const context = canvas.getContext('2d');
+        // Clear previous drawings
+        context.clearRect(0, 0, canvas.width, canvas.height);
+        context.drawImage(video, 0, 0, canvas.width, canvas.height);
+
+        // Draw new results
+        drawRecognitionResults(results, scale);
+
+        // Check if any names were marked
+        const marked = results.some(r => r.name.includes('(Marked)'));
+        if (marked) {
+            updateTodayAttendance(); // Refresh list if new person marked
+        }
+    }
+
+    async function postFrame() {
         if (processing || !stream) return; // Don't send if previous is still processing
         
         processing = true;
@@ -70,6 +200,10 @@ document.addEventListener('DOMContentLoaded', () => {
         canvas.toBlob(async (blob) => {
             const formData = new FormData();
             formData.append('image', blob, 'webcam_frame.jpg');
+            formData.append('camera_id', cameraId);
+            if (selectedGroupId() !== null) {
+                formData.append('group_id', selectedGroupId());
+            }
 
             try {
                 const response = await fetch('/api/recognize', {
@@ -82,19 +216,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 }
 
                 const data = await response.json();
-                
-                // Clear previous drawings
-                context.clearRect(0, 0, canvas.width, canvas.height);
-                context.drawImage(video, 0, 0, canvas.width, canvas.height);
-
-                // Draw new results
-                drawRecognitionResults(data.results);
-
-                // Check if any names were marked
-                const marked = data.results.some(r => r.name.includes('(Marked)'));
-                if (marked) {
-                    updateTodayAttendance(); // Refresh list if new person marked
-                }
+                showResults(data.results);
 
             } catch (err) {
                 console.error('Error sending frame:', err);
@@ -104,24 +226,28 @@ document.addEventListener('DOMContentLoaded', () => {
         }, 'image/jpeg');
     }
 
-    function drawRecognitionResults(results) {
+    function drawRecognitionResults(results, scale = 1) {
         const context = canvas.getContext('2d');
         context.lineWidth = 3;
         context.font = '16px Arial';
 
         results.forEach(res => {
-            const [top, right, bottom, left] = res.location;
+            const [top, right, bottom, left] = res.location.map(v => v * scale);
             const isUnknown = res.name === 'Unknown';
+            // Red for unknown, amber for faces too poor to recognize, green for known
+            const color = res.quality ? '#FFA500' : (isUnknown ? '#FF0000' : '#00FF00');
 
             // Draw rectangle
-            context.strokeStyle = isUnknown ? '#FF0000' : '#00FF00'; // Red for unknown, Green for known
+            context.strokeStyle = color;
             context.beginPath();
             context.rect(left, top, right - left, bottom - top);
             context.stroke();
 
             // Draw label background
-            context.fillStyle = isUnknown ? '#FF0000' : '#00FF00';
-            const text = `${res.name} (${res.confidence})`;
+            context.fillStyle = color;
+            const text = res.quality
+                ? `${res.name} (${res.quality.replace('_', ' ')})`
+                : `${res.name} (${res.confidence})`;
             const textMetrics = context.measureText(text);
             context.fillRect(left, bottom - 20, textMetrics.width + 8, 20);
 
@@ -131,16 +257,44 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
+    // Polled incrementally: only records newer than the last seen id are
+    // fetched, and an unchanged list costs a 304
+    let attendanceEtag = null;
+    let attendanceDate = null;
+    let lastAttendanceId = null;
+
     async function updateTodayAttendance() {
         if (!attendanceList) return;
         try {
-            const response = await fetch('/api/attendance/today');
+            const url = lastAttendanceId === null
+                ? '/api/attendance/today'
+                : `/api/attendance/today?since=${lastAttendanceId}`;
+            const headers = attendanceEtag ? { 'If-None-Match': attendanceEtag } : {};
+            const response = await fetch(url, { headers });
+            if (response.status === 304) return;
+
+            const day = response.headers.get('X-Attendance-Date');
+            if (day !== attendanceDate && lastAttendanceId !== null) {
+                // A new day started; load the whole list again
+                attendanceDate = day;
+                attendanceEtag = null;
+                lastAttendanceId = null;
+                return updateTodayAttendance();
+            }
             const data = await response.json();
-            
-            attendanceList.innerHTML = ''; // Clear list
-            if (data.length === 0) {
-                attendanceList.innerHTML = '<li class="text-gray-500">No attendance marked yet today.</li>';
-            } else {
+            attendanceDate = day;
+            attendanceEtag = response.headers.get('ETag');
+
+            if (lastAttendanceId === null) {
+                attendanceList.innerHTML = ''; // Clear list
+            }
+            if (data.length > 0) {
+                lastAttendanceId = Math.max(lastAttendanceId || 0, ...data.map(rec => rec.id));
+                const placeholder = attendanceList.querySelector('.attendance-empty');
+                if (placeholder) placeholder.remove();
+
+                // Newest first, above the records already shown
+                const fragment = document.createDocumentFragment();
                 data.forEach(rec => {
                     const li = document.createElement('li');
                     li.className = 'flex justify-between items-center p-2 border-b';
@@ -151,8 +305,12 @@ document.addEventListener('DOMContentLoaded', () => {
                         </span>
                         <span class="text-sm font-medium text-gray-700">${rec.time}</span>
                     `;
-                    attendanceList.appendChild(li);
+                    fragment.appendChild(li);
                 });
+                attendanceList.prepend(fragment);
+            } else if (lastAttendanceId === null) {
+                lastAttendanceId = 0;
+                attendanceList.innerHTML = '<li class="attendance-empty text-gray-500">No attendance marked yet today.</li>';
             }
         } catch (err) {
             console.error('Error fetching today\'s attendance:', err);
@@ -187,6 +345,57 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     });
 
+    // --- Registration Logic ---
+    const registerForm = document.getElementById('register-form');
+    const registerStatus = document.getElementById('register-status');
+
+    if (registerForm) {
+        registerForm.addEventListener('submit', async (e) => {
+            e.preventDefault();
+            const submitBtn = registerForm.querySelector('button[type="submit"]');
+            submitBtn.disabled = true;
+            registerStatus.classList.remove('hidden');
+            registerStatus.textContent = 'Uploading images...';
+
+            try {
+                const response = await fetch(registerForm.action, {
+                    method: 'POST',
+                    body: new FormData(registerForm),
+                    headers: { 'Accept': 'application/json' }
+                });
+                const data = await response.json();
+                if (!response.ok) {
+                    throw new Error(data.error || response.statusText);
+                }
+                await pollEnrollmentJob(data.status_url);
+            } catch (err) {
+                console.error('Registration error:', err);
+                registerStatus.textContent = `Error: ${err.message}`;
+                submitBtn.disabled = false;
+            }
+        });
+    }
+
+    async function pollEnrollmentJob(statusUrl) {
+        while (true) {
+            const response = await fetch(statusUrl);
+            const job = await response.json();
+            if (!response.ok) {
+                throw new Error(job.error || response.statusText);
+            }
+
+            registerStatus.textContent = `Encoding images: ${job.progress.done} of ${job.progress.total} done...`;
+            if (job.status === 'done') {
+                window.location.href = '/students/';
+                return;
+            }
+            if (job.status === 'failed') {
+                throw new Error(job.message);
+            }
+            await new Promise(resolve => setTimeout(resolve, 500));
+        }
+    }
+
     // --- Reports Logic ---
     const reportForm = document.getElementById('report-form');
     const reportResults = document.getElementById('report-results');